@@ -0,0 +1,441 @@
+"""扫描引擎基准测试
+
+生成可复现的合成目录树（大量小文件、少量大文件、深层嵌套、宽目录、植入特征与压缩包），
+用 ScanEngine 的各扫描模式扫描，输出 JSON 结果：文件/秒、MB/秒、每个文件的读写系统调用数、
+峰值内存与耗时。系统调用数默认取 /proc/self/io 中的读写次数，
+指定 --strace 时用 strace 统计全部系统调用。指定 --baseline 时与之前的结果比较，超过回退阈值时以状态码 1 退出。
+
+用法: python benchmarks/bench_scan.py [--scale 0.1] [--output result.json] [--baseline old.json]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from core.scan_engine import ScanEngine
+
+# 生成数据的格式版本，修改生成逻辑后需递增，使已缓存的目录树重新生成
+TREE_VERSION = 1
+SEED = 20240101
+
+EICAR = b'X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*'
+
+# 场景：名称 -> 说明，生成函数为 gen_<名称>；文件数量与大小按 --scale 缩放
+SCENARIOS = {
+    'small': '大量小文件（1-16KB，分布在多个目录）',
+    'huge': '少量大文件',
+    'deep': '深层嵌套目录',
+    'wide': '单个目录中的大量文件',
+    'mixed': '植入特征的文件与 zip / tar.gz 压缩包',
+}
+
+# 扫描模式：serial 单进程；parallel 多进程；cached 第二次扫描（缓存命中）；async 异步并发 I/O
+MODES = ('serial', 'parallel', 'cached', 'async')
+
+# 与基准比较的指标：名称 -> 方向（1 越大越好，-1 越小越好）
+COMPARED_METRICS = {
+    'files_per_sec': 1,
+    'mb_per_sec': 1,
+    'syscalls_per_file': -1,
+    'peak_rss_mb': -1,
+}
+
+_WORDS = ('scan', 'engine', 'signature', 'archive', 'virus', 'cloud', 'file', 'path', 'data', 'trust',
+          'quarantine', 'update', 'report', 'thread', 'buffer', 'mount')
+
+
+def _text(rng, size):
+    """生成指定大小的文本内容"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).encode()[:size]
+
+
+def _content(rng, size):
+    """一半文本、一半随机二进制数据，覆盖不同的文件类型"""
+    if rng.random() < 0.5:
+        return _text(rng, size)
+    return rng.randbytes(size)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _count(base, scale):
+    return max(int(base * scale), 1)
+
+
+def gen_small(root, rng, scale):
+    for i in range(_count(20000, scale)):
+        _write(os.path.join(root, f'd{i % 200:03d}', f'f{i:06d}.dat'), _content(rng, rng.randint(1024, 16 * 1024)))
+    return 0
+
+
+def gen_huge(root, rng, scale):
+    size = _count(256 * 1024 * 1024, scale)
+    chunk = rng.randbytes(1024 * 1024)
+    for i in range(4):
+        path = os.path.join(root, f'huge{i}.bin')
+        os.makedirs(root, exist_ok=True)
+        with open(path, 'wb') as f:
+            # 文件内容以同一块随机数据循环填充，生成速度快且不影响扫描耗时
+            remaining = size
+            while remaining > 0:
+                f.write(chunk[:remaining])
+                remaining -= len(chunk)
+    return 0
+
+
+def gen_deep(root, rng, scale):
+    depth = 64
+    for chain in range(_count(50, scale)):
+        directory = os.path.join(root, f'chain{chain:03d}')
+        for level in range(depth):
+            directory = os.path.join(directory, f'l{level}')
+            _write(os.path.join(directory, 'f.dat'), _content(rng, rng.randint(256, 4096)))
+    return 0
+
+
+def gen_wide(root, rng, scale):
+    for i in range(_count(20000, scale)):
+        _write(os.path.join(root, f'f{i:06d}.txt'), _text(rng, rng.randint(256, 4096)))
+    return 0
+
+
+def gen_mixed(root, rng, scale):
+    """返回植入的威胁数量（每个被感染的文件或压缩包计一次）"""
+    planted = 0
+    for i in range(_count(2000, scale)):
+        if i % 100 == 0:
+            # EICAR 特征限定于文本文件，植入到文本内容中
+            data = _text(rng, rng.randint(1024, 64 * 1024))
+            offset = rng.randint(0, len(data))
+            data = data[:offset] + EICAR + data[offset:]
+            planted += 1
+        else:
+            data = _content(rng, rng.randint(1024, 64 * 1024))
+        _write(os.path.join(root, 'files', f'f{i:05d}.dat'), data)
+
+    for i in range(_count(100, scale)):
+        infected = i % 10 == 0
+        members = [(f'm{j:02d}.txt', _text(rng, rng.randint(1024, 32 * 1024))) for j in range(20)]
+        if infected:
+            members.append(('payload/evil.com', EICAR))
+            planted += 1
+        buffer = io.BytesIO()
+        if i % 2 == 0:
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name, data in members:
+                    archive.writestr(name, data)
+            _write(os.path.join(root, 'archives', f'a{i:04d}.zip'), buffer.getvalue())
+        else:
+            with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+                for name, data in members:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mtime = 0
+                    archive.addfile(info, io.BytesIO(data))
+            _write(os.path.join(root, 'archives', f'a{i:04d}.tar.gz'), buffer.getvalue())
+    return planted
+
+
+def ensure_tree(tree_dir, scenario, scale):
+    """生成场景目录树；参数相同的目录树已存在时直接复用
+
+    返回 (目录, 植入的威胁数量)。
+    """
+    root = os.path.join(tree_dir, scenario)
+    marker = os.path.join(tree_dir, f'{scenario}.json')
+    spec = {'version': TREE_VERSION, 'seed': SEED, 'scale': scale}
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved['spec'] == spec and os.path.isdir(root):
+            return root, saved['planted']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    # 每个场景使用独立的随机数序列，单独重新生成某个场景不影响其他场景
+    rng = random.Random(f'{SEED}-{scenario}')
+    planted = globals()[f'gen_{scenario}'](root, rng, scale)
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump({'spec': spec, 'planted': planted}, f)
+    return root, planted
+
+
+def _tree_size(root):
+    files = 0
+    size = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(directory, name))
+    return files, size
+
+
+def _io_syscalls():
+    """本进程（含已回收的子进程）的读写系统调用次数，不支持的平台返回 None"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines() if ': ' in line)
+        return int(counters['syscr']) + int(counters['syscw'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    """本进程与已回收子进程（工作进程）的峰值内存，取两者中较大者"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peaks = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(max(peaks) / divisor, 1)
+
+
+def inject_latency(seconds):
+    """模拟网络文件系统：每次列出目录、stat 与打开文件前等待指定秒数（等待期间释放 GIL）"""
+    import builtins
+
+    def delayed(function):
+        def wrapper(*args, **kwargs):
+            time.sleep(seconds)
+            return function(*args, **kwargs)
+        return wrapper
+    os.scandir = delayed(os.scandir)
+    os.stat = delayed(os.stat)
+    builtins.open = delayed(builtins.open)
+
+
+def run_one(root, mode, options, scan=True):
+    """在当前进程中执行一次扫描并返回指标（由子进程调用，保证峰值内存互不影响）
+
+    scan 为 False 时只执行扫描前的准备工作，用于从 strace 统计中扣除准备阶段的系统调用。
+    """
+    os.chdir(ROOT_DIR)
+    files, size = _tree_size(root)
+    cache_path = None
+    if mode == 'cached':
+        cache_path = os.path.join(tempfile.mkdtemp(prefix='bench_cache_'), 'scan_cache.db')
+        ScanEngine(cache_path=cache_path).custom_scan(root)
+    engine = ScanEngine(workers=options.workers if mode == 'parallel' else 1, cache_path=cache_path,
+                        io_concurrency=options.async_io if mode == 'async' else 0)
+    if not scan:
+        return {}
+    if options.latency:
+        inject_latency(options.latency / 1000)
+
+    syscalls = _io_syscalls()
+    start = time.perf_counter()
+    threats = engine.custom_scan(root)
+    wall = time.perf_counter() - start
+    if syscalls is not None:
+        syscalls = _io_syscalls() - syscalls
+    if cache_path:
+        shutil.rmtree(os.path.dirname(cache_path), ignore_errors=True)
+
+    count = engine.scan_count
+    return {
+        'files': count,
+        'bytes': size,
+        'tree_files': files,
+        'threats': len(threats),
+        'cache_hits': engine.cache_hits,
+        'wall_sec': round(wall, 3),
+        'files_per_sec': round(count / wall, 1) if wall else None,
+        'mb_per_sec': round(size / (1024 * 1024) / wall, 2) if wall else None,
+        'syscalls_per_file': round(syscalls / count, 2) if syscalls is not None and count else None,
+        'syscalls_source': 'proc_io' if syscalls is not None else None,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _child_command(root, mode, options, scan=True):
+    command = [sys.executable, os.path.abspath(__file__), '--run-one', root, '--mode', mode,
+               '--workers', str(options.workers), '--async-io', str(options.async_io),
+               '--latency', str(options.latency)]
+    return command if scan else command + ['--no-scan']
+
+
+def run_case(root, mode, options):
+    """在子进程中执行一次扫描"""
+    output = subprocess.run(_child_command(root, mode, options), check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+
+def _strace_calls(command):
+    """在 strace -c 下运行命令（跟踪所有子进程），返回系统调用总数"""
+    with tempfile.NamedTemporaryFile(prefix='bench_strace_', suffix='.txt', delete=False) as f:
+        summary = f.name
+    try:
+        subprocess.run(['strace', '-f', '-c', '-o', summary] + command, check=True, stdout=subprocess.DEVNULL)
+        with open(summary, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                # 汇总行：% time, seconds, usecs/call, calls, [errors,] total
+                if fields and fields[-1] == 'total':
+                    return int(fields[3])
+    finally:
+        os.remove(summary)
+    return None
+
+
+def count_syscalls(root, mode, options, files):
+    """用 strace 统计每个文件的全部系统调用数（open、stat、mmap 等，不限于读写）
+
+    strace 会显著拖慢扫描，因此单独运行，不影响计时结果；扣除只做准备工作的一次运行。
+    """
+    total = _strace_calls(_child_command(root, mode, options))
+    setup = _strace_calls(_child_command(root, mode, options, scan=False))
+    if total is None or setup is None or not files:
+        return None
+    return round(max(total - setup, 0) / files, 2)
+
+
+def compare(results, baseline, threshold):
+    """与基准结果比较，返回回退项列表（场景、模式、指标、基准值、当前值、变化比例）"""
+    # 注入延迟不同的结果不可比较
+    previous = {(r['scenario'], r['mode'], r.get('latency_ms', 0)): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result['scenario'], result['mode'], result.get('latency_ms', 0)))
+        if not old:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            if metric == 'syscalls_per_file' and old.get('syscalls_source') != result.get('syscalls_source'):
+                # 统计方式不同（读写次数 / strace 全部调用）的结果不可比较
+                continue
+            change = (after - before) / before
+            if change * direction < -threshold:
+                regressions.append({
+                    'scenario': result['scenario'],
+                    'mode': result['mode'],
+                    'metric': metric,
+                    'baseline': before,
+                    'current': after,
+                    'change': round(change, 3),
+                })
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='扫描引擎基准测试')
+    parser.add_argument('--scale', type=float, default=1.0, help='文件数量与大小的缩放比例（默认 1.0）')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔的场景列表：' + ','.join(SCENARIOS))
+    parser.add_argument('--modes', default=','.join(MODES), help='逗号分隔的扫描模式：' + ','.join(MODES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='parallel 模式的进程数')
+    parser.add_argument('--async-io', type=int, default=64, help='async 模式同时进行的 I/O 操作数')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='为列出目录、stat 与打开文件注入的延迟（毫秒），模拟网络文件系统')
+    parser.add_argument('--tree-dir', default=os.path.join(tempfile.gettempdir(), 'jisu_bench_trees'),
+                        help='合成目录树的存放目录，参数不变时复用')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--baseline', help='用于比较的基准结果 JSON 文件')
+    parser.add_argument('--threshold', type=float, default=0.1, help='回退阈值（比例，默认 0.1 即 10%%）')
+    parser.add_argument('--strace', action='store_true', help='用 strace 统计全部系统调用（需要安装 strace）')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', default='serial', help=argparse.SUPPRESS)
+    parser.add_argument('--no-scan', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.mode, args, scan=not args.no_scan)))
+        return 0
+    if args.strace and not shutil.which('strace'):
+        parser.error('未找到 strace')
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    modes = [m for m in args.modes.split(',') if m]
+    unknown = [s for s in scenarios if s not in SCENARIOS] + [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error('未知的场景或模式: ' + ', '.join(unknown))
+
+    results = []
+    for scenario in scenarios:
+        print(f"生成目录树: {scenario}（{SCENARIOS[scenario]}）", file=sys.stderr)
+        root, planted = ensure_tree(args.tree_dir, scenario, args.scale)
+        for mode in modes:
+            result = run_case(root, mode, args)
+            if args.strace:
+                result['syscalls_per_file'] = count_syscalls(root, mode, args, result['files'])
+                result['syscalls_source'] = 'strace'
+            result = {'scenario': scenario, 'mode': mode, 'workers': args.workers if mode == 'parallel' else 1,
+                      'latency_ms': args.latency, 'threats_expected': planted, **result}
+            results.append(result)
+            print(f"  {mode:8s} {result['files']} 个文件, {result['wall_sec']:.2f}s, "
+                  f"{result['files_per_sec']} 文件/s, {result['mb_per_sec']} MB/s, "
+                  f"威胁 {result['threats']}/{planted}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': args.scale,
+            'latency_ms': args.latency,
+            'seed': SEED,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(results, baseline, args.threshold)
+        for item in report['regressions']:
+            print(f"性能回退: {item['scenario']}/{item['mode']} {item['metric']} "
+                  f"{item['baseline']} -> {item['current']} ({item['change']:+.1%})", file=sys.stderr)
+        if report['regressions']:
+            status = 1
+    # 检出数量与植入数量不符说明扫描结果有误，同样视为失败
+    if any(r['threats'] != r['threats_expected'] for r in results):
+        print("检出的威胁数量与植入数量不一致", file=sys.stderr)
+        status = 1
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""特征匹配器基准测试
+
+用法: python benchmarks/bench_signature_matcher.py [特征数量] [数据MB]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.signature_matcher import SignatureMatcher
+
+
+def make_signatures(count, rng):
+    """生成随机特征（长度 8-32 字节）"""
+    return [(f"Bench.Sig.{i}", rng.randbytes(rng.randint(8, 32))) for i in range(count)]
+
+
+def main():
+    signature_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    data_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    rng = random.Random(20240101)
+
+    signatures = make_signatures(signature_count, rng)
+    start = time.perf_counter()
+    matcher = SignatureMatcher(signatures)
+    build_time = time.perf_counter() - start
+
+    data = rng.randbytes(data_mb * 1024 * 1024)
+    chunk_size = SignatureMatcher.DEFAULT_CHUNK_SIZE
+    start = time.perf_counter()
+    state = 0
+    for offset in range(0, len(data), chunk_size):
+        state, found = matcher.feed(data[offset:offset + chunk_size], state)
+        if found >= 0:
+            state = 0
+    scan_time = time.perf_counter() - start
+
+    print(f"特征数量: {signature_count}")
+    print(f"自动机状态数: {len(matcher.base)}")
+    print(f"构建耗时: {build_time:.2f}s")
+    print(f"扫描数据: {data_mb} MB, 耗时 {scan_time:.2f}s, 吞吐 {data_mb / scan_time:.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import zipfile
+import zlib
+
+# 判断容器类型需要读取的文件头长度（tar 的 ustar 标识位于偏移 257）
+HEADER_SIZE = 512
+READ_SIZE = 64 * 1024
+
+# 嵌套的 zip 需要随机访问，在内存中缓存的上限，超过时不展开该 zip，扫描结果记为不完整
+NESTED_ZIP_MAX_SIZE = 32 * 1024 * 1024
+
+# 解压比例检查的起点，避免小文件因高压缩率（如全零数据）被误判
+RATIO_FLOOR = 16 * 1024 * 1024
+
+ARCHIVE_BOMB = 'Heuristic.ArchiveBomb'
+
+# 压缩文件名后缀，去掉后作为解压后内容的名称
+_COMPRESSED_SUFFIXES = {'.gz': '', '.bz2': '', '.xz': '', '.tgz': '.tar', '.tbz2': '.tar', '.txz': '.tar'}
+
+_OPENERS = {
+    'gzip': lambda fileobj: gzip.GzipFile(fileobj=fileobj, mode='rb'),
+    'bz2': bz2.BZ2File,
+    'xz': lzma.LZMAFile,
+}
+
+# 损坏、加密或不支持的压缩格式，跳过对应的容器或成员
+_ARCHIVE_ERRORS = (zipfile.BadZipFile, zipfile.LargeZipFile, tarfile.TarError, EOFError, OSError,
+                   ValueError, NotImplementedError, RuntimeError, zlib.error, lzma.LZMAError)
+
+
+class ArchiveLimitExceeded(Exception):
+    """解压总量或成员数量超过限制，停止扫描该容器"""
+
+
+class ArchiveBombError(ArchiveLimitExceeded):
+    """解压比例超过限制，判定为压缩炸弹"""
+
+    def __init__(self, member):
+        super().__init__(member)
+        self.member = member
+
+
+def archive_type(head):
+    """根据文件头判断容器类型，返回 zip / tar / gzip / bz2 / xz，非容器返回 None"""
+    if head.startswith(b'PK\x03\x04'):
+        return 'zip'
+    if head.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if head.startswith(b'\xfd7zXZ\x00'):
+        return 'xz'
+    if head.startswith(b'BZh') and head[3:4].isdigit() and head[4:10] == b'1AY&SY':
+        return 'bz2'
+    if head[257:262] == b'ustar':
+        return 'tar'
+    return None
+
+
+def _decompressed_name(name):
+    base, ext = os.path.splitext(name)
+    suffix = _COMPRESSED_SUFFIXES.get(ext.lower())
+    if suffix is None:
+        return name
+    return (base + suffix) or 'data'
+
+
+class _Budget:
+    """一次容器扫描的解压额度，所有嵌套层级共享"""
+
+    def __init__(self, scanner, compressed_size, checkpoint):
+        self.max_total = scanner.max_total_bytes
+        self.max_ratio_total = max(compressed_size * scanner.max_ratio, RATIO_FLOOR)
+        self.max_members = scanner.max_members
+        self.checkpoint = checkpoint
+        self.total = 0
+        self.members = 0
+        self.incomplete = False
+
+    def add_member(self):
+        self.members += 1
+        if self.members > self.max_members:
+            raise ArchiveLimitExceeded('members')
+
+    def consume(self, size, member):
+        self.total += size
+        if self.total > self.max_ratio_total:
+            raise ArchiveBombError(member)
+        if self.total > self.max_total:
+            raise ArchiveLimitExceeded('total')
+
+
+class _MemberReader:
+    """读取成员内容：统计解压字节数，并把读到的数据同时送入流式检测器"""
+
+    def __init__(self, stream, budget, member, detector):
+        self._stream = stream
+        self._budget = budget
+        self._member = member
+        self._detector = detector
+        self._head = b''
+        self.threat = None
+
+    def read(self, size=-1):
+        if self._head:
+            # 已读取的文件头先返回（已送入检测器，不再重复检测）
+            if size is None or size < 0:
+                size = len(self._head) + READ_SIZE
+            data, self._head = self._head[:size], self._head[size:]
+            return data
+        if self._budget.checkpoint:
+            self._budget.checkpoint()
+        if size is None or size < 0:
+            size = READ_SIZE
+        data = self._stream.read(size)
+        if data:
+            self._budget.consume(len(data), self._member)
+            if self.threat is None:
+                self.threat = self._detector.update(data)
+        return data
+
+    def rewind_head(self, head):
+        """把已读取的文件头放回，供容器解析器从头读取"""
+        self._head = head
+
+
+class ArchiveScanner:
+    """容器文件扫描（zip、tar、tar.gz/bz2/xz、gz/bz2/xz）
+
+    成员内容以流的方式送入检测器，不解压到磁盘。
+    限制嵌套深度、解压总量、成员数量以及解压后与压缩前的大小比例，超过比例时判定为压缩炸弹。
+    嵌套的 zip 需要随机访问，在内存中缓存，超过 NESTED_ZIP_MAX_SIZE 时不展开（结果不完整）。
+    命中时返回的成员路径以 ! 分隔各级容器，例如 outer.zip!inner.tar!evil.exe。
+    """
+
+    def __init__(self, max_depth=3, max_total_bytes=1024 * 1024 * 1024, max_ratio=100, max_members=10000):
+        self.max_depth = max_depth
+        self.max_total_bytes = max_total_bytes
+        self.max_ratio = max_ratio
+        self.max_members = max_members
+
+    @property
+    def enabled(self):
+        return self.max_depth > 0
+
+    @property
+    def version(self):
+        """扫描设置的标识，设置改变后缓存的扫描结果不再有效"""
+        if not self.enabled:
+            return 'archive-off'
+        return f'archive-{self.max_depth}-{self.max_total_bytes}-{self.max_ratio}-{self.max_members}'
+
+    def scan_file(self, fileobj, size, name, detector_factory, checkpoint=None, head=None):
+        """扫描已打开的容器文件（可随机访问的二进制文件对象，从头读取）
+
+        detector_factory() 返回流式检测器，需提供 update(数据块) 与 finish() 两个方法，
+        均返回威胁名称或 None。head 为已读取的文件头（前 HEADER_SIZE 字节），可省略。
+        返回 (威胁名称, 成员路径, 是否扫描完整)，不是容器或未命中时威胁名称与成员路径为 None；
+        解压总量或成员数量超过限制而停止、或有嵌套 zip 过大未展开时，未命中的结果不完整，
+        不应作为安全结果缓存。
+        """
+        if not self.enabled or not size:
+            return None, None, True
+        if head is None:
+            fileobj.seek(0)
+            head = fileobj.read(HEADER_SIZE)
+        kind = archive_type(head)
+        if kind is None:
+            return None, None, True
+        budget = _Budget(self, size, checkpoint)
+        try:
+            fileobj.seek(0)
+            result = self._scan_container(kind, fileobj, name, '', 1, budget, detector_factory)
+        except ArchiveBombError as e:
+            return ARCHIVE_BOMB, e.member, True
+        except ArchiveLimitExceeded:
+            return None, None, False
+        except _ARCHIVE_ERRORS:
+            return None, None, True
+        if result:
+            return result[0], result[1], True
+        return None, None, not budget.incomplete
+
+    def _scan_container(self, kind, fileobj, name, prefix, depth, budget, detector_factory):
+        """扫描一个容器的所有成员，prefix 为成员路径前缀"""
+        if kind == 'zip':
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    # 跳过目录与加密成员
+                    if info.is_dir() or info.flag_bits & 0x1:
+                        continue
+                    budget.add_member()
+                    member = prefix + info.filename
+                    if info.file_size > RATIO_FLOOR and info.file_size > info.compress_size * self.max_ratio:
+                        raise ArchiveBombError(member)
+                    try:
+                        with archive.open(info) as stream:
+                            result = self._scan_member(stream, info.filename, member, depth, budget,
+                                                       detector_factory)
+                    except _ARCHIVE_ERRORS:
+                        continue
+                    if result:
+                        return result
+            return None
+
+        if kind == 'tar':
+            # 流模式顺序读取，不需要随机访问，可直接读取解压流
+            with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+                for info in archive:
+                    if not info.isreg():
+                        continue
+                    budget.add_member()
+                    stream = archive.extractfile(info)
+                    result = self._scan_member(stream, os.path.basename(info.name), prefix + info.name,
+                                               depth, budget, detector_factory)
+                    if result:
+                        return result
+            return None
+
+        # 单文件压缩格式：解压后的内容作为一个成员；若其中是 tar 则直接展开，不增加一层路径
+        member_name = _decompressed_name(name)
+        with _OPENERS[kind](fileobj) as stream:
+            member = prefix + member_name
+            detector = detector_factory()
+            reader = _MemberReader(stream, budget, member, detector)
+            head = reader.read(HEADER_SIZE)
+            if archive_type(head) == 'tar':
+                reader.rewind_head(head)
+                return self._scan_container('tar', reader, member_name, prefix, depth, budget, detector_factory)
+            return self._finish_member(reader, head, member_name, member, depth, budget, detector_factory,
+                                       detector)
+
+    def _scan_member(self, stream, name, member, depth, budget, detector_factory):
+        """扫描一个成员的内容，成员本身是容器且未超过嵌套深度时继续展开"""
+        detector = detector_factory()
+        reader = _MemberReader(stream, budget, member, detector)
+        head = reader.read(HEADER_SIZE)
+        return self._finish_member(reader, head, name, member, depth, budget, detector_factory, detector)
+
+    def _finish_member(self, reader, head, name, member, depth, budget, detector_factory, detector):
+        kind = archive_type(head) if depth < self.max_depth else None
+        if kind:
+            reader.rewind_head(head)
+            nested = self._buffer(reader) if kind == 'zip' else reader
+            if nested is None:
+                # 嵌套 zip 过大，已读取的数据仍经过检测，其余部分按普通数据读完
+                budget.incomplete = True
+            else:
+                try:
+                    result = self._scan_container(kind, nested, name, member + '!', depth + 1, budget,
+                                                  detector_factory)
+                    if result:
+                        return result
+                except _ARCHIVE_ERRORS:
+                    # 嵌套容器损坏时按普通数据处理
+                    pass
+                finally:
+                    if nested is not reader:
+                        nested.close()
+        # 读完剩余数据，完成特征匹配与哈希计算
+        try:
+            while reader.threat is None and reader.read(READ_SIZE):
+                pass
+        except _ARCHIVE_ERRORS:
+            return (reader.threat, member) if reader.threat else None
+        threat = reader.threat or detector.finish()
+        return (threat, member) if threat else None
+
+    @staticmethod
+    def _buffer(reader):
+        """把成员内容读入内存，供需要随机访问的嵌套 zip 使用；超过 NESTED_ZIP_MAX_SIZE 时返回 None"""
+        buffer = io.BytesIO()
+        while True:
+            data = reader.read(READ_SIZE)
+            if not data:
+                break
+            buffer.write(data)
+            if buffer.tell() > NESTED_ZIP_MAX_SIZE:
+                buffer.close()
+                return None
+        buffer.seek(0)
+        return buffer
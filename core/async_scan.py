@@ -0,0 +1,243 @@
+import asyncio
+import os
+import stat
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from core.file_walker import _ENTRY_STAT_HAS_INODE, FileRoot
+from core.scan_control import ScanCancelled
+from core.scan_engine import ScanItem
+from core.verdict_cache import VerdictCache
+
+
+def _list_directory(directory, prune, want_keys):
+    """在线程池中列出一个目录
+
+    返回 (目录自身的 (st_dev, st_ino), 文件列表 [(路径, 缓存键)], 子目录列表 [(路径, st_dev, st_ino)],
+    被过滤器跳过的目录数, 耗时)。
+    """
+    start = time.perf_counter()
+    st = os.stat(directory)
+    files = []
+    subdirs = []
+    pruned = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if prune and prune(entry.path):
+                        pruned += 1
+                        continue
+                    if _ENTRY_STAT_HAS_INODE:
+                        sub = entry.stat(follow_symlinks=False)
+                    else:
+                        sub = os.stat(entry.path, follow_symlinks=False)
+                    subdirs.append((entry.path, sub.st_dev, sub.st_ino))
+                elif entry.is_file():
+                    files.append((entry.path, VerdictCache.make_key(entry) if want_keys else None))
+            except OSError:
+                continue
+    return (st.st_dev, st.st_ino), files, subdirs, pruned, time.perf_counter() - start
+
+
+class AsyncScanPipeline:
+    """基于 asyncio 的枚举 → 过滤 → 读取/检测流水线（用于高延迟的网络文件系统）
+
+    目录列出与文件检测在有界线程池中执行，最多同时进行 concurrency 个操作，
+    同一设备（挂载点）上同时进行的操作不超过 mount_concurrency 个。
+    事件循环在调用方线程中按需推进：每取一个结果运行一次，线程池中的操作在两次取结果之间继续执行；
+    过滤、缓存查询与结果报告都在调用方线程中进行，与同步模式的行为一致（结果顺序按完成先后）。
+    提供与 FileWalker 相同的统计属性与 estimated_total()，供进度计算与扫描指标使用。
+    """
+
+    def __init__(self, engine, paths, prune=None, one_file_system=False, cache=None,
+                 concurrency=256, mount_concurrency=64):
+        self.engine = engine
+        self.paths = [path for path in paths if path]
+        self.prune = prune
+        self.one_file_system = one_file_system
+        self.cache = cache
+        self.concurrency = max(int(concurrency), 1)
+        self.mount_concurrency = max(int(mount_concurrency), 1)
+        self.files_found = 0
+        self.dirs_listed = 0
+        self.pending_dirs = 0
+        self.dirs_skipped = 0
+        self.dirs_pruned = 0
+        self._executor = None
+        self._mount_limits = {}
+        self._visited = set()
+        self._listings = set()
+        self._checks = set()
+        self._slots = None
+        self._results = None
+        self._error = None
+
+    def estimated_total(self):
+        """估算文件总数（与 FileWalker.estimated_total 相同）"""
+        if not self.dirs_listed:
+            return max(self.files_found, 1)
+        average = self.files_found / self.dirs_listed
+        return max(int(self.files_found + self.pending_dirs * average), self.files_found, 1)
+
+    def items(self):
+        """按完成顺序产出填写了检测结果的 ScanItem（缓存命中的文件不检测）"""
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='async-scan')
+        loop.set_default_executor(self._executor)
+        producer = None
+        try:
+            loop.run_until_complete(self._setup())
+            producer = loop.create_task(self._produce())
+            while True:
+                item = loop.run_until_complete(self._results.get())
+                if item is None:
+                    break
+                yield item
+            if self._error:
+                raise self._error
+        finally:
+            tasks = [task for task in self._listings | self._checks if not task.done()]
+            if producer and not producer.done():
+                tasks.append(producer)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            loop.close()
+
+    async def _setup(self):
+        # 队列与信号量在事件循环中创建
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._results = asyncio.Queue(maxsize=self.concurrency * 4)
+
+    def _mount_limit(self, device):
+        limit = self._mount_limits.get(device)
+        if limit is None:
+            limit = self._mount_limits[device] = asyncio.Semaphore(self.mount_concurrency)
+        return limit
+
+    async def _produce(self):
+        """调度目录列出任务，并为需要检测的文件创建检测任务"""
+        try:
+            await self._walk()
+            if self._checks:
+                await asyncio.gather(*self._checks)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            self._error = e
+        await self._results.put(None)
+
+    async def _walk(self):
+        engine = self.engine
+        metrics = engine.metrics
+        checkpoint = engine._checkpoint
+        # 待列出的目录：(路径, 所在扫描路径的设备号, 自身设备号)，扫描路径的设备号在列出后获得
+        pending = deque()
+        for path in reversed(self.paths):
+            if self.prune and self.prune(path):
+                continue
+            # 扫描路径本身是普通文件时直接进入过滤阶段
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                pending.append((path, None, None))
+            elif (st.st_dev, st.st_ino) not in self._visited:
+                self._visited.add((st.st_dev, st.st_ino))
+                self.files_found += 1
+                cache_key = VerdictCache.make_key(FileRoot(path, st)) if self.cache is not None else None
+                await self._dispatch(path, cache_key, st.st_dev)
+        self.pending_dirs = len(pending)
+        active = self._listings
+        while pending or active:
+            while pending and len(active) < self.concurrency:
+                active.add(asyncio.ensure_future(self._list(*pending.pop())))
+            done, _ = await asyncio.wait(active, return_when=asyncio.FIRST_COMPLETED)
+            active -= done
+            for task in done:
+                self.pending_dirs -= 1
+                root_device, result = task.result()
+                if checkpoint:
+                    checkpoint()
+                if isinstance(result, OSError):
+                    if metrics:
+                        metrics.error(result.errno)
+                    continue
+                key, files, subdirs, pruned, elapsed = result
+                self.dirs_pruned += pruned
+                if root_device is None:
+                    # 扫描路径之间可能互相包含，列出后按 (st_dev, st_ino) 去重
+                    if key in self._visited:
+                        self.dirs_skipped += 1
+                        continue
+                    self._visited.add(key)
+                    root_device = key[0]
+                if metrics:
+                    metrics.observe('list', elapsed)
+                self.dirs_listed += 1
+                self.files_found += len(files)
+                for path, device, inode in reversed(subdirs):
+                    if (device, inode) in self._visited or (self.one_file_system and device != root_device):
+                        self.dirs_skipped += 1
+                        continue
+                    self._visited.add((device, inode))
+                    pending.append((path, root_device, device))
+                    self.pending_dirs += 1
+                for path, cache_key in files:
+                    await self._dispatch(path, cache_key, key[0])
+
+    async def _list(self, directory, root_device, device):
+        """在线程池中列出目录，出错时结果为 OSError"""
+        loop = asyncio.get_running_loop()
+        async with self._mount_limit(device):
+            try:
+                result = await loop.run_in_executor(None, _list_directory, directory, self.prune,
+                                                    self.cache is not None)
+            except OSError as e:
+                result = e
+        return root_device, result
+
+    async def _dispatch(self, path, cache_key, device):
+        """过滤阶段：与同步模式的 _filter_stage 相同，缓存命中的文件直接报告"""
+        engine = self.engine
+        metrics = engine.metrics
+        if metrics:
+            start = time.perf_counter()
+            excluded = engine._is_excluded(path)
+            metrics.observe('filter', time.perf_counter() - start)
+            if excluded:
+                metrics.skipped_trusted += 1
+                return
+        elif engine._is_excluded(path):
+            return
+        item = ScanItem(path)
+        if self.cache:
+            item.key = cache_key
+            item.cached = self.cache.is_clean(cache_key)
+        if item.cached:
+            await self._results.put(item)
+            return
+        # 同时进行的检测数量有上限，到达上限时暂停列出目录
+        await self._slots.acquire()
+        task = asyncio.ensure_future(self._check(item, device))
+        self._checks.add(task)
+        task.add_done_callback(self._checks.discard)
+
+    async def _check(self, item, device):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._mount_limit(device):
+                result = await loop.run_in_executor(None, self.engine._throttled_check, item.path)
+        except ScanCancelled:
+            return
+        finally:
+            self._slots.release()
+        item.update_from(result)
+        if self.cache and item.scanned and not item.threat and not item.incomplete:
+            self.cache.store_clean(item.key)
+        await self._results.put(item)
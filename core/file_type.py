@@ -0,0 +1,68 @@
+from core.archive_scanner import HEADER_SIZE, archive_type
+
+# 文件类型（特征库中可用这些名称限定特征适用的文件类型）
+FILE_TYPES = ('elf', 'pe', 'script', 'archive', 'document', 'media', 'text', 'unknown', 'empty')
+
+# 判断类型只需要文件开头的数据，与容器扫描共用同一段文件头
+SNIFF_SIZE = HEADER_SIZE
+
+_DOCUMENT_MAGIC = (
+    b'%PDF-',
+    b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',  # OLE2（doc/xls/ppt/msi）
+    b'{\\rtf',
+)
+
+_MEDIA_MAGIC = (
+    b'\x89PNG\r\n\x1a\n',
+    b'\xff\xd8\xff',  # JPEG
+    b'GIF87a',
+    b'GIF89a',
+    b'II*\x00',  # TIFF
+    b'MM\x00*',
+    b'ID3',  # MP3
+    b'OggS',
+    b'fLaC',
+    b'\x1aE\xdf\xa3',  # Matroska / WebM
+)
+
+_ARCHIVE_MAGIC = (
+    b'7z\xbc\xaf\x27\x1c',
+    b'Rar!\x1a\x07',
+)
+
+# OOXML / ODF 文档本身是 zip，以第一个成员的名称区分
+_ZIP_DOCUMENT_MEMBERS = (b'[Content_Types].xml', b'mimetypeapplication/vnd.oasis')
+
+
+def sniff_file_type(head):
+    """根据文件头（前 SNIFF_SIZE 字节）判断文件类型，返回 FILE_TYPES 中的名称"""
+    if not head:
+        return 'empty'
+    if head.startswith(b'\x7fELF'):
+        return 'elf'
+    if head.startswith(b'MZ'):
+        return 'pe'
+    if head.startswith(b'#!'):
+        return 'script'
+    if head.startswith(_DOCUMENT_MAGIC):
+        return 'document'
+    kind = archive_type(head)
+    if kind == 'zip' and head[30:].startswith(_ZIP_DOCUMENT_MEMBERS):
+        return 'document'
+    if kind or head.startswith(_ARCHIVE_MAGIC):
+        return 'archive'
+    if head.startswith(_MEDIA_MAGIC) or head[4:8] == b'ftyp' or \
+            (head.startswith(b'RIFF') and head[8:12] in (b'WAVE', b'AVI ', b'WEBP')):
+        return 'media'
+    if b'\0' not in head and _is_text(head):
+        return 'text'
+    return 'unknown'
+
+
+def _is_text(head):
+    """UTF-8 文本判断，末尾被截断的多字节字符不影响结果"""
+    try:
+        head.decode('utf-8')
+        return True
+    except UnicodeDecodeError as e:
+        return e.start >= len(head) - 3 and e.reason == 'unexpected end of data'
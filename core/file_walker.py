@@ -0,0 +1,130 @@
+import os
+import stat
+import time
+
+# Windows 下 DirEntry.stat() 不提供 st_dev 与 st_ino，需要调用 os.stat
+_ENTRY_STAT_HAS_INODE = os.name != 'nt'
+
+
+class FileRoot:
+    """作为扫描路径直接指定的文件，提供与 os.DirEntry 相同的接口（供过滤阶段与缓存键使用）"""
+
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path, st):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = st
+
+    def inode(self):
+        return self._stat.st_ino
+
+    def stat(self, follow_symlinks=True):
+        return self._stat
+
+    def is_file(self, follow_symlinks=True):
+        return True
+
+    def is_dir(self, follow_symlinks=True):
+        return False
+
+
+class FileWalker:
+    """目录遍历器
+
+    基于 os.scandir 单次遍历目录树，直接复用 DirEntry 缓存的类型信息，
+    无需预先统计文件总数；遍历过程中根据已发现的文件与待遍历目录估算总数。
+    扫描路径本身是普通文件时直接产出（FileRoot）。
+    prune 为可选的判断函数，返回 True 的目录在列出之前即被整体跳过。
+    目录按 (st_dev, st_ino) 去重，绑定挂载或重叠的扫描路径只遍历一次；
+    one_file_system 为 True 时不进入与所在扫描路径不同设备的目录。
+    metrics 为可选的 ScanMetrics，记录列出每个目录的耗时与出错的 errno。
+    """
+
+    def __init__(self, paths, prune=None, one_file_system=False, metrics=None):
+        self.paths = [path for path in paths if path]
+        self.prune = prune
+        self.one_file_system = one_file_system
+        self.metrics = metrics
+        self.files_found = 0
+        self.dirs_listed = 0
+        self.pending_dirs = 0
+        self.dirs_skipped = 0
+        self.dirs_pruned = 0
+
+    def __iter__(self):
+        return self.walk()
+
+    def walk(self):
+        """逐个产出文件的 DirEntry（扫描路径为文件时为 FileRoot）"""
+        prune = self.prune
+        one_file_system = self.one_file_system
+        metrics = self.metrics
+        visited = set()
+        # 扫描路径的设备号在出栈时获取（为 None），扫描路径之间可能互相包含，需在出栈时去重
+        stack = [(path, None) for path in reversed(self.paths) if not (prune and prune(path))]
+        self.pending_dirs = len(stack)
+        while stack:
+            directory, device = stack.pop()
+            self.pending_dirs -= 1
+            if device is None:
+                try:
+                    st = os.stat(directory)
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) in visited:
+                    self.dirs_skipped += 1
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+                if stat.S_ISREG(st.st_mode):
+                    self.files_found += 1
+                    yield FileRoot(directory, st)
+                    continue
+                device = st.st_dev
+            if metrics:
+                start = time.perf_counter()
+            files = []
+            subdirs = []
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if prune and prune(entry.path):
+                                    self.dirs_pruned += 1
+                                    continue
+                                if _ENTRY_STAT_HAS_INODE:
+                                    st = entry.stat(follow_symlinks=False)
+                                else:
+                                    st = os.stat(entry.path, follow_symlinks=False)
+                                key = (st.st_dev, st.st_ino)
+                                if key in visited or (one_file_system and st.st_dev != device):
+                                    self.dirs_skipped += 1
+                                    continue
+                                visited.add(key)
+                                subdirs.append((entry.path, device))
+                            elif entry.is_file():
+                                files.append(entry)
+                        except OSError:
+                            continue
+            except OSError as e:
+                if metrics:
+                    metrics.error(e.errno)
+                continue
+            if metrics:
+                metrics.observe('list', time.perf_counter() - start)
+
+            self.dirs_listed += 1
+            self.files_found += len(files)
+            # 逆序入栈，保证按目录列出顺序深度优先遍历
+            stack.extend(reversed(subdirs))
+            self.pending_dirs += len(subdirs)
+
+            yield from files
+
+    def estimated_total(self):
+        """估算文件总数（随遍历推进逐步增长）"""
+        if not self.dirs_listed:
+            return max(self.files_found, 1)
+        average = self.files_found / self.dirs_listed
+        return max(int(self.files_found + self.pending_dirs * average), self.files_found, 1)
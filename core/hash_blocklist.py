@@ -0,0 +1,263 @@
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+# 文件格式:
+#   文件头 | 布隆过滤器位图 | 有序摘要表 | 前缀索引
+# 前缀索引按摘要前两个字节分为 65536 个桶，记录每个桶在摘要表中的起始序号
+_MAGIC = b'JSHB'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sI8s8sIIQQQQQ')
+_INDEX_BUCKETS = 65536
+# 摘要本身是均匀分布的，直接取前 16 字节作为布隆过滤器的两个基础哈希值
+_BLOOM_KEYS = struct.Struct('<QQ')
+
+# 计算文件哈希时每次送入 hashlib 的数据量，大块数据计算时会释放 GIL
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def hash_buffer(data, algorithms=('sha256',), checkpoint=None):
+    """计算缓冲区（bytes / memoryview）的哈希，按块送入 hashlib
+
+    checkpoint 为可选的取消点函数，在每个分块之前调用。
+    返回 {算法名: 摘要字节}
+    """
+    hashers = {name: hashlib.new(name) for name in algorithms}
+    view = memoryview(data)
+    try:
+        for offset in range(0, len(view), HASH_CHUNK_SIZE):
+            if checkpoint:
+                checkpoint()
+            chunk = view[offset:offset + HASH_CHUNK_SIZE]
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            chunk.release()
+    finally:
+        view.release()
+    return {name: hasher.digest() for name, hasher in hashers.items()}
+
+
+def hash_file(file_path, algorithms=('sha256',), checkpoint=None):
+    """通过 mmap 计算文件哈希，不把文件内容复制为 Python bytes
+
+    返回 {算法名: 摘要字节}
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return hash_buffer(b'', algorithms)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hash_buffer(mm, algorithms, checkpoint)
+
+
+class HashBlocklist:
+    """恶意文件哈希黑名单
+
+    黑名单文件以只读方式 mmap，常驻内存的只有实际访问到的页面。
+    查询先经过布隆过滤器，绝大多数安全文件无需访问摘要表；
+    过滤器命中后再通过前缀索引在有序摘要表中二分查找。
+    查询为纯 Python 实现，未命中的查询约 1～2 微秒（主要是解释器开销），与计算文件哈希相比可以忽略。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._open()
+
+    def _open(self):
+        with open(self.file_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, algorithm, self.version, self.digest_size, self.hash_count,
+         self.bloom_bits, bloom_offset, self.count, table_offset, index_offset) = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"无效的哈希黑名单文件: {self.file_path}")
+        self.algorithm = algorithm.rstrip(b'\0').decode('ascii')
+        self.version = self.version.hex()
+        self._bloom_offset = bloom_offset
+        self._table_offset = table_offset
+        self._index = memoryview(self._mm)[index_offset:index_offset + (_INDEX_BUCKETS + 1) * 8].cast('Q')
+
+    def __getstate__(self):
+        # mmap 无法序列化，工作进程中按路径重新映射，共享同一份页缓存
+        return {'file_path': self.file_path}
+
+    def __setstate__(self, state):
+        self.file_path = state['file_path']
+        self._open()
+
+    def __len__(self):
+        return self.count
+
+    def might_contain(self, digest):
+        """布隆过滤器检查，返回 False 时摘要一定不在黑名单中
+
+        k 个探测位置由摘要前 16 字节一次解析出的两个值按双重哈希得出，不再对每个位置单独计算哈希。
+        """
+        mm = self._mm
+        offset = self._bloom_offset
+        bits = self.bloom_bits
+        h1, h2 = _BLOOM_KEYS.unpack_from(digest)
+        h2 |= 1
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % bits
+            if not mm[offset + (position >> 3)] >> (position & 7) & 1:
+                return False
+        return True
+
+    def __contains__(self, digest):
+        if len(digest) != self.digest_size or not self.might_contain(digest):
+            return False
+        bucket = int.from_bytes(digest[:2], 'big')
+        low = self._index[bucket]
+        high = self._index[bucket + 1]
+        size = self.digest_size
+        mm = self._mm
+        base = self._table_offset
+        while low < high:
+            middle = (low + high) // 2
+            start = base + middle * size
+            current = mm[start:start + size]
+            if current == digest:
+                return True
+            if current < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+    def close(self):
+        self._index.release()
+        self._mm.close()
+
+    @staticmethod
+    def build(output_path, digests, algorithm='sha256', bits_per_entry=10, run_size=1000000):
+        """由摘要序列构建黑名单文件
+
+        使用外部排序：分段排序写入临时文件后归并，内存占用只与 run_size 和布隆过滤器大小有关。
+        返回去重后的摘要数量。
+        """
+        digest_size = hashlib.new(algorithm).digest_size
+        temp_dir = os.path.dirname(os.path.abspath(output_path))
+        runs = []
+        total = 0
+        try:
+            # 1. 分段排序
+            buffer = []
+            for digest in digests:
+                if len(digest) != digest_size:
+                    continue
+                buffer.append(bytes(digest))
+                if len(buffer) >= run_size:
+                    runs.append(HashBlocklist._write_run(buffer, temp_dir))
+                    total += len(buffer)
+                    buffer = []
+            if buffer:
+                runs.append(HashBlocklist._write_run(buffer, temp_dir))
+                total += len(buffer)
+
+            # 2. 按预计数量确定布隆过滤器参数
+            bloom_bits = max(total * bits_per_entry, 64)
+            bloom_bits = (bloom_bits + 63) // 64 * 64
+            hash_count = max(1, round(bits_per_entry * 0.693))
+            bloom = bytearray(bloom_bits // 8)
+            bloom_offset = _HEADER.size
+            table_offset = bloom_offset + len(bloom)
+
+            # 3. 归并去重，写入摘要表并同时填充布隆过滤器与前缀索引
+            counts = [0] * _INDEX_BUCKETS
+            version = hashlib.sha256()
+            count = 0
+            temp_path = output_path + '.tmp'
+            with open(temp_path, 'wb') as out:
+                out.write(bytes(table_offset))
+                readers = [HashBlocklist._read_run(path, digest_size) for path in runs]
+                previous = None
+                for digest in heapq.merge(*readers):
+                    if digest == previous:
+                        continue
+                    previous = digest
+                    out.write(digest)
+                    version.update(digest)
+                    counts[int.from_bytes(digest[:2], 'big')] += 1
+                    h1, h2 = _BLOOM_KEYS.unpack_from(digest)
+                    h2 |= 1
+                    for i in range(hash_count):
+                        position = (h1 + i * h2) % bloom_bits
+                        bloom[position >> 3] |= 1 << (position & 7)
+                    count += 1
+
+                index_offset = table_offset + count * digest_size
+                start = 0
+                index = [0]
+                for bucket_count in counts:
+                    start += bucket_count
+                    index.append(start)
+                out.write(struct.pack(f'<{len(index)}Q', *index))
+
+                out.seek(0)
+                out.write(_HEADER.pack(
+                    _MAGIC, _FORMAT_VERSION, algorithm.encode('ascii').ljust(8, b'\0'),
+                    version.digest()[:8], digest_size, hash_count, bloom_bits,
+                    bloom_offset, count, table_offset, index_offset
+                ))
+                out.write(bloom)
+            os.replace(temp_path, output_path)
+            return count
+        finally:
+            for path in runs:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _write_run(buffer, temp_dir):
+        buffer.sort()
+        fd, path = tempfile.mkstemp(prefix='hashrun_', dir=temp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b''.join(buffer))
+        return path
+
+    @staticmethod
+    def _read_run(path, digest_size):
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(digest_size * 4096)
+                if not block:
+                    return
+                for offset in range(0, len(block), digest_size):
+                    yield block[offset:offset + digest_size]
+
+
+def _read_hex_digests(file_path):
+    """读取文本哈希列表（每行一个十六进制摘要，可附带空格分隔的说明）"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                yield bytes.fromhex(line.split()[0])
+            except ValueError:
+                continue
+
+
+def main(argv=None):
+    """命令行: python -m core.hash_blocklist 哈希列表.txt 输出.db [sha256|md5]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print(main.__doc__)
+        return 2
+    algorithm = argv[2] if len(argv) > 2 else 'sha256'
+    count = HashBlocklist.build(argv[1], _read_hex_digests(argv[0]), algorithm)
+    print(f"已写入 {count} 个哈希到 {argv[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,137 +1,521 @@
+import errno
+import hashlib
 import os
 import shutil
+import stat
+import threading
 import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from core.quarantine_retention import RetentionPolicy
+from core.quarantine_store import QuarantineStore
+
+# 读写隔离数据的块大小
+BLOCK_SIZE = 1024 * 1024
+
+# 数据块的压缩格式
+BLOB_CODEC = 'zlib'
+
+# 放入数据块并写入引用、删除引用并删除数据块文件都在此锁内进行，
+# 后台清理删除数据块时不会与同时隔离的相同内容冲突
+_BLOB_LOCK = threading.Lock()
+
+
+def write_blob(source_path, output_path):
+    """读取文件，同时计算 SHA-256 并以流方式压缩写入 output_path，返回 (sha256, 原大小, 压缩后大小)"""
+    digest = hashlib.sha256()
+    compressor = zlib.compressobj(6)
+    size = 0
+    with open(source_path, 'rb') as src, open(output_path, 'wb') as out:
+        while True:
+            data = src.read(BLOCK_SIZE)
+            if not data:
+                break
+            size += len(data)
+            digest.update(data)
+            out.write(compressor.compress(data))
+        out.write(compressor.flush())
+        stored_size = out.tell()
+        out.flush()
+        os.fsync(out.fileno())
+    return digest.hexdigest(), size, stored_size
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def copy_verified(source_path, output_path):
+    """跨设备复制：流式复制并 fsync，再重新读取副本校验 SHA-256，不一致时抛出 OSError"""
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as src, open(output_path, 'wb') as out:
+        for data in iter(lambda: src.read(BLOCK_SIZE), b''):
+            digest.update(data)
+            out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    if file_sha256(output_path) != digest.hexdigest():
+        raise OSError(errno.EIO, '隔离文件复制后校验失败', output_path)
+
+
+def fsync_dir(path):
+    """同步目录项（不支持打开目录的平台上忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def extract_blob(blob_path, output_path, sha256):
+    """以流方式解压数据块到 output_path，内容与 sha256 不符时抛出 ValueError"""
+    digest = hashlib.sha256()
+    decompressor = zlib.decompressobj()
+    with open(blob_path, 'rb') as src, open(output_path, 'wb') as out:
+        while True:
+            data = src.read(BLOCK_SIZE)
+            if not data:
+                break
+            # 限制每次解压输出的大小，内存占用与文件大小无关
+            data = decompressor.decompress(data, BLOCK_SIZE)
+            while data:
+                digest.update(data)
+                out.write(data)
+                data = decompressor.decompress(decompressor.unconsumed_tail, BLOCK_SIZE)
+        data = decompressor.flush()
+        digest.update(data)
+        out.write(data)
+    if digest.hexdigest() != sha256:
+        raise ValueError('隔离数据块校验失败')
 
 class QuarantineManager:
-    """隔离区管理器"""
+    """隔离区管理器
+    
+    隔离记录保存在 quarantine.db 中（见 QuarantineStore），每个项目有唯一的隔离 ID；
+    旧版本的 quarantine.log 在首次启动时自动迁移。
+    隔离内容按 SHA-256 压缩保存在 quarantine/blobs 下，相同内容只保存一份（按引用计数删除），
+    恢复时解压到原路径并还原权限与访问、修改时间。
+    
+    隔离按日志进行：先提交隔离意图，再把原文件移入暂存区（同一设备直接 rename，跨设备时复制、fsync、
+    校验后再删除原文件），最后压缩保存并在同一事务中写入隔离记录、结束日志。
+    启动时根据日志继续（原文件已移走）或撤销（原文件仍在原处）被中断的操作。
+    
+    保留策略（见 RetentionPolicy）由 compact() 分批执行，可以在后台线程中运行。
+    """
+    
+    # 批量恢复与删除时同时进行的文件操作数
+    BATCH_WORKERS = 8
+    
+    # 按保留策略清理时每批删除的项目数与批次之间的间隔（秒）
+    COMPACT_BATCH = 50
+    COMPACT_PAUSE = 0.05
     
     def __init__(self):
         self.quarantine_dir = os.path.join(os.getcwd(), 'quarantine')
         self.quarantine_log = os.path.join(os.getcwd(), 'quarantine.log')
+        self.quarantine_db = os.path.join(os.getcwd(), 'quarantine.db')
+        self.blob_dir = os.path.join(self.quarantine_dir, 'blobs')
+        self.temp_dir = os.path.join(self.quarantine_dir, 'tmp')
         self._init_quarantine()
     
     def _init_quarantine(self):
         """初始化隔离区"""
-        if not os.path.exists(self.quarantine_dir):
-            os.makedirs(self.quarantine_dir)
+        for directory in (self.quarantine_dir, self.blob_dir, self.temp_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
         
-        if not os.path.exists(self.quarantine_log):
-            with open(self.quarantine_log, 'w', encoding='utf-8') as f:
-                pass
+        self.store = QuarantineStore(self.quarantine_db)
+        self._migrate_log()
+        self._recover()
+    
+    def _migrate_log(self):
+        """迁移旧版 quarantine.log：导入成功后改名为 quarantine.log.migrated"""
+        try:
+            if os.path.getsize(self.quarantine_log) == 0:
+                return
+        except OSError:
+            return
+        self.store.import_log(self.quarantine_log)
+        os.replace(self.quarantine_log, self.quarantine_log + '.migrated')
+    
+    def _find_item(self, key):
+        """按隔离 ID 查找项目；兼容旧接口，找不到时按原路径精确查找"""
+        item = self.store.get(key) or self.store.find_by_path(key)
+        if item:
+            self.store.touch(item['id'])
+        return item
+    
+    def _blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
     
     def quarantine_file(self, file_path):
-        """隔离文件"""
+        """隔离文件，原文件移出并保存为数据块后返回 True
+        
+        移入暂存区后保存失败（如磁盘已满）时返回 False，文件留在暂存区，下次启动时继续保存。
+        """
         try:
             if not os.path.exists(file_path):
                 return False
             
-            # 生成隔离文件名
-            file_name = os.path.basename(file_path)
-            quarantine_time = time.strftime('%Y%m%d_%H%M%S')
-            quarantine_file = os.path.join(self.quarantine_dir, f"{quarantine_time}_{file_name}")
-            
-            # 移动文件到隔离区
-            shutil.move(file_path, quarantine_file)
+            st = os.stat(file_path)
+            op_id = uuid.uuid4().hex
+            operation = {
+                'op_id': op_id,
+                'item_id': self.store.new_id(),
+                'file_name': os.path.basename(file_path),
+                'original_path': file_path,
+                'staging_path': os.path.join(self.temp_dir, f"{op_id}.staged"),
+                'quarantine_time': time.strftime('%Y%m%d_%H%M%S'),
+                'mode': stat.S_IMODE(st.st_mode),
+                'atime_ns': st.st_atime_ns,
+                'mtime_ns': st.st_mtime_ns,
+            }
+            # 先记录隔离意图，再移动文件
+            self.store.begin_operation(**operation)
             
-            # 记录隔离日志
-            with open(self.quarantine_log, 'a', encoding='utf-8') as f:
-                f.write(f"{quarantine_time},{file_name},{file_path},{quarantine_file}\n")
+            # 移出原位置，失败时原文件仍在原处，撤销操作
+            try:
+                self._stage(file_path, operation['staging_path'], st)
+            except Exception:
+                _remove_quietly(operation['staging_path'] + '.part')
+                _remove_quietly(operation['staging_path'])
+                self.store.end_operation(op_id)
+                return False
+            self.store.mark_staged(op_id)
             
+            self._store_staged(operation)
             return True
         except Exception:
             return False
     
-    def restore_file(self, original_path):
-        """恢复文件"""
+    def _stage(self, file_path, staging_path, st):
+        """把原文件移入暂存区：同一设备直接 rename，跨设备时复制并校验后删除原文件"""
+        if st.st_dev == os.stat(self.temp_dir).st_dev:
+            try:
+                os.rename(file_path, staging_path)
+                fsync_dir(self.temp_dir)
+                return
+            except OSError as e:
+                # 同一文件系统的不同挂载点之间也不能 rename
+                if e.errno != errno.EXDEV:
+                    raise
+        part_path = staging_path + '.part'
+        copy_verified(file_path, part_path)
+        os.replace(part_path, staging_path)
+        fsync_dir(self.temp_dir)
+        os.remove(file_path)
+    
+    def _store_staged(self, operation):
+        """把暂存区中的文件压缩保存为数据块，写入隔离记录并结束日志"""
+        staging_path = operation['staging_path']
+        temp_path = f"{staging_path}.blob"
         try:
-            # 查找隔离文件
-            quarantine_file = None
-            with open(self.quarantine_log, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split(',', 3)
-                    if len(parts) == 4 and parts[2] == original_path:
-                        quarantine_file = parts[3]
-                        break
-            
-            if not quarantine_file or not os.path.exists(quarantine_file):
+            sha256, size, stored_size = write_blob(staging_path, temp_path)
+            blob_path = self._blob_path(sha256)
+            with _BLOB_LOCK:
+                if os.path.exists(blob_path):
+                    os.remove(temp_path)
+                else:
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.replace(temp_path, blob_path)
+                    fsync_dir(os.path.dirname(blob_path))
+                
+                self.store.add_blob_item(operation['item_id'], operation['file_name'], operation['original_path'],
+                                         operation['quarantine_time'], blob_path, sha256, size, stored_size,
+                                         BLOB_CODEC, operation['mode'], operation['atime_ns'],
+                                         operation['mtime_ns'], op_id=operation['op_id'])
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+        _remove_quietly(staging_path)
+    
+    def _recover(self):
+        """处理上次中断的隔离操作，并清理暂存区中不属于任何操作的临时文件"""
+        for operation in self.store.operations():
+            staging_path = operation['staging_path']
+            if operation['state'] == 'intent':
+                if os.path.lexists(operation['original_path']) or not os.path.exists(staging_path):
+                    # 原文件未移走（或已无从恢复）：撤销
+                    _remove_quietly(staging_path + '.part')
+                    if os.path.lexists(operation['original_path']):
+                        _remove_quietly(staging_path)
+                    self.store.end_operation(operation['op_id'])
+                    continue
+                self.store.mark_staged(operation['op_id'])
+            elif not os.path.exists(staging_path):
+                self.store.end_operation(operation['op_id'])
+                continue
+            # 原文件已移入暂存区：继续保存
+            try:
+                self._store_staged(operation)
+            except Exception:
+                pass
+        
+        pending = {operation['staging_path'] for operation in self.store.operations()}
+        for name in os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, name)
+            if path not in pending:
+                _remove_quietly(path)
+    
+    def _restore_item(self, item):
+        """恢复一个项目的文件到原路径"""
+        if item['sha256'] is None:
+            # 旧版本直接移动到隔离区的文件
+            if not os.path.exists(item['quarantine_path']):
+                return False
+            shutil.move(item['quarantine_path'], item['file_path'])
+            return True
+        
+        # 先解压到原目录中的临时文件，校验并还原权限与时间后替换
+        temp_path = f"{item['file_path']}.{item['id'][:8]}.restoring"
+        try:
+            extract_blob(item['quarantine_path'], temp_path, item['sha256'])
+            os.chmod(temp_path, item['mode'])
+            os.utime(temp_path, ns=(item['atime_ns'], item['mtime_ns']))
+            os.replace(temp_path, item['file_path'])
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return True
+    
+    def _delete_blobs(self, sha256_list):
+        """删除引用计数已降为 0 的数据块文件"""
+        for sha256 in sha256_list:
+            try:
+                os.remove(self._blob_path(sha256))
+            except OSError:
+                pass
+    
+    def _release(self, store, item_ids):
+        """删除记录，并删除不再被引用的数据块文件，返回这些数据块的 SHA-256 列表"""
+        with _BLOB_LOCK:
+            orphans = store.remove_many(item_ids)
+            self._delete_blobs(orphans)
+        return orphans
+    
+    def restore_file(self, item_id):
+        """恢复文件（item_id 为隔离 ID，也可以是原路径）"""
+        try:
+            item = self._find_item(item_id)
+            if not item or not self._restore_item(item):
                 return False
             
-            # 恢复文件
-            shutil.move(quarantine_file, original_path)
-            
-            # 更新日志
-            new_log_lines = []
-            with open(self.quarantine_log, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if original_path not in line:
-                        new_log_lines.append(line)
-            
-            with open(self.quarantine_log, 'w', encoding='utf-8') as f:
-                f.writelines(new_log_lines)
+            # 删除隔离记录
+            self._release(self.store, [item['id']])
             
             return True
         except Exception:
             return False
     
-    def delete_file(self, original_path):
-        """删除隔离文件"""
+    def delete_file(self, item_id):
+        """删除隔离文件（item_id 为隔离 ID，也可以是原路径）"""
         try:
-            # 查找隔离文件
-            quarantine_file = None
-            with open(self.quarantine_log, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split(',', 3)
-                    if len(parts) == 4 and parts[2] == original_path:
-                        quarantine_file = parts[3]
-                        break
-            
-            if quarantine_file and os.path.exists(quarantine_file):
-                os.remove(quarantine_file)
+            item = self._find_item(item_id)
+            if not item:
+                return False
             
-            # 更新日志
-            new_log_lines = []
-            with open(self.quarantine_log, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if original_path not in line:
-                        new_log_lines.append(line)
+            if item['sha256'] is None and os.path.exists(item['quarantine_path']):
+                os.remove(item['quarantine_path'])
             
-            with open(self.quarantine_log, 'w', encoding='utf-8') as f:
-                f.writelines(new_log_lines)
+            # 删除隔离记录，数据块不再被引用时一并删除
+            self._release(self.store, [item['id']])
             
             return True
         except Exception:
             return False
     
+    def restore_many(self, item_ids):
+        """批量恢复文件，返回 {隔离 ID: 是否成功}
+        
+        解压与移动并行进行；恢复到同一原路径的多个项目只恢复最近隔离的一个，其余视为失败。
+        成功项目的记录在一个事务中删除。
+        """
+        item_ids = list(dict.fromkeys(item_ids))
+        results = dict.fromkeys(item_ids, False)
+        try:
+            items = self.store.get_many(item_ids)
+        except Exception:
+            return results
+        
+        # 同一目标路径只保留最近的一项，避免并行恢复互相覆盖
+        targets = {}
+        for item in sorted(items.values(), key=lambda item: item['created']):
+            targets[item['file_path']] = item
+        
+        def restore(item):
+            try:
+                return self._restore_item(item)
+            except Exception:
+                return False
+        
+        self._run_batch(restore, targets.values(), results)
+        self._remove_records([item_id for item_id, success in results.items() if success], results)
+        return results
+    
+    def delete_many(self, item_ids):
+        """批量删除隔离文件，返回 {隔离 ID: 是否成功}
+        
+        文件删除并行进行（隔离文件已不存在的项目同样视为成功），成功项目的记录在一个事务中删除。
+        """
+        item_ids = list(dict.fromkeys(item_ids))
+        results = dict.fromkeys(item_ids, False)
+        try:
+            items = self.store.get_many(item_ids)
+        except Exception:
+            return results
+        
+        def delete(item):
+            # 数据块可能被其他项目引用，由引用计数决定是否删除
+            if item['sha256'] is not None:
+                return True
+            try:
+                os.remove(item['quarantine_path'])
+                return True
+            except FileNotFoundError:
+                return True
+            except Exception:
+                return False
+        
+        self._run_batch(delete, items.values(), results)
+        self._remove_records([item_id for item_id, success in results.items() if success], results)
+        return results
+    
+    def _run_batch(self, operation, items, results):
+        """并行执行文件操作，结果写入 results"""
+        items = list(items)
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.BATCH_WORKERS, len(items))) as executor:
+            for item, success in zip(items, executor.map(operation, items)):
+                results[item['id']] = success
+    
+    def _remove_records(self, item_ids, results):
+        """删除成功项目的记录；提交失败时这些项目视为失败（文件已处理，下次操作时按文件状态重新判断）"""
+        try:
+            self._release(self.store, item_ids)
+        except Exception:
+            for item_id in item_ids:
+                results[item_id] = False
+    
+    def compact(self, policy=None, batch_size=None, should_stop=None):
+        """按保留策略分批删除项目，每批完成后产出 (删除的隔离 ID 列表, 释放的字节数)
+        
+        policy 默认从 quarantine_settings.json 读取。使用独立的数据库连接，可以在后台线程中运行；
+        每批在一个事务中提交，批次之间暂停 COMPACT_PAUSE 秒，should_stop() 返回 True 时在批次之间停止。
+        """
+        policy = policy or RetentionPolicy.load()
+        if not policy.enabled:
+            return
+        batch_size = batch_size or self.COMPACT_BATCH
+        store = QuarantineStore(self.quarantine_db)
+        try:
+            while not (should_stop and should_stop()):
+                removed, reclaimed = self._evict(store, self._eviction_batch(store, policy, batch_size))
+                if not removed:
+                    break
+                yield removed, reclaimed
+                time.sleep(self.COMPACT_PAUSE)
+        finally:
+            store.close()
+    
+    def _eviction_batch(self, store, policy, limit):
+        """选出下一批待删除的项目：依次处理超过保留时间、超过项目数与超过占用空间的部分"""
+        if policy.max_age is not None:
+            candidates = store.eviction_candidates(policy.order, limit, before=time.time() - policy.max_age)
+            if candidates:
+                return candidates
+        
+        if policy.max_items is not None:
+            excess = store.count() - policy.max_items
+            if excess > 0:
+                return store.eviction_candidates(policy.order, min(excess, limit))
+        
+        if policy.max_bytes is not None:
+            excess = store.total_bytes() - policy.max_bytes
+            if excess > 0:
+                # 数据块在最后一个引用删除后才释放空间，按引用计数估算，释放足够空间即停止
+                candidates = []
+                remaining = {}
+                reclaimed = 0
+                for candidate in store.eviction_candidates(policy.order, limit):
+                    candidates.append(candidate)
+                    sha256 = candidate['sha256']
+                    if sha256 is None:
+                        reclaimed += candidate['size'] or 0
+                    else:
+                        remaining[sha256] = remaining.get(sha256, candidate['refcount']) - 1
+                        if remaining[sha256] <= 0:
+                            reclaimed += candidate['stored_size']
+                    if reclaimed >= excess:
+                        break
+                return candidates
+        return []
+    
+    def _evict(self, store, candidates):
+        """删除一批项目，返回 (删除的隔离 ID 列表, 释放的字节数)；旧版项目的文件删除失败时保留该项目"""
+        removed = []
+        reclaimed = 0
+        for candidate in candidates:
+            if candidate['sha256'] is None:
+                try:
+                    size = os.path.getsize(candidate['quarantine_path'])
+                    os.remove(candidate['quarantine_path'])
+                    reclaimed += size
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+            removed.append(candidate['id'])
+        if not removed:
+            return removed, reclaimed
+        
+        stored_sizes = {candidate['sha256']: candidate['stored_size'] for candidate in candidates}
+        for sha256 in self._release(store, removed):
+            reclaimed += stored_sizes.get(sha256) or 0
+        return removed, reclaimed
+    
     def get_quarantine_items(self):
         """获取隔离区项目"""
-        items = []
         try:
-            with open(self.quarantine_log, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split(',', 3)
-                    if len(parts) == 4:
-                        items.append({
-                            'quarantine_time': parts[0],
-                            'file_name': parts[1],
-                            'file_path': parts[2],
-                            'quarantine_path': parts[3]
-                        })
+            return self.store.items()
         except Exception:
-            pass
-        return items
+            return []
     
     def empty_quarantine(self):
         """清空隔离区"""
         try:
-            # 删除所有隔离文件
+            # 删除所有隔离文件与数据块
             for file in os.listdir(self.quarantine_dir):
                 file_path = os.path.join(self.quarantine_dir, file)
-                if os.path.isfile(file_path):
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+                else:
                     os.remove(file_path)
+            os.makedirs(self.blob_dir)
+            os.makedirs(self.temp_dir)
             
-            # 清空日志
-            with open(self.quarantine_log, 'w', encoding='utf-8') as f:
-                pass
+            # 清空记录
+            self.store.clear()
             
             return True
         except Exception:
@@ -0,0 +1,57 @@
+import json
+import os
+
+# 保留策略配置文件
+SETTINGS_FILE = 'quarantine_settings.json'
+
+
+class RetentionPolicy:
+    """隔离区保留策略
+
+    max_bytes: 隔离区最多占用的字节数（数据块压缩后大小）
+    max_age: 项目最长保留时间（秒，按隔离时间计算）
+    max_items: 最多保留的项目数
+    eviction: 超出限制时的删除顺序，oldest 按隔离时间、lru 按最近使用时间从旧到新
+    限制为 None 表示不限制；超过任一限制时删除项目，直到全部限制都满足。
+    """
+
+    EVICTION_ORDERS = ('oldest', 'lru')
+
+    def __init__(self, max_bytes=None, max_age=None, max_items=None, eviction='oldest'):
+        if eviction not in self.EVICTION_ORDERS:
+            raise ValueError(f'unknown eviction order: {eviction}')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_items = max_items
+        self.eviction = eviction
+
+    @property
+    def enabled(self):
+        return any(limit is not None for limit in (self.max_bytes, self.max_age, self.max_items))
+
+    @property
+    def order(self):
+        """QuarantineStore.eviction_candidates 的排序列"""
+        return 'accessed' if self.eviction == 'lru' else 'created'
+
+    @classmethod
+    def load(cls, path=None):
+        """从 quarantine_settings.json 读取保留策略，文件不存在或格式错误时不限制
+
+        配置项：max_size_mb、max_age_days、max_items、eviction（oldest 或 lru）。
+        """
+        path = path or os.path.join(os.getcwd(), SETTINGS_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+            max_size_mb = settings.get('max_size_mb')
+            max_age_days = settings.get('max_age_days')
+            max_items = settings.get('max_items')
+            return cls(
+                max_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb is not None else None,
+                max_age=max_age_days * 86400 if max_age_days is not None else None,
+                max_items=int(max_items) if max_items is not None else None,
+                eviction=settings.get('eviction', 'oldest'),
+            )
+        except (OSError, ValueError, TypeError, AttributeError):
+            return cls()
@@ -0,0 +1,261 @@
+import sqlite3
+import time
+import uuid
+
+# 迁移旧日志时生成确定的 ID，中断后重新迁移不会产生重复记录
+_LOG_NAMESPACE = uuid.UUID('6f1c8a52-3d7e-4b8f-9a61-2c5d0e4b7a13')
+
+# 批量查询每条语句的参数个数（低于 SQLite 的默认上限 999）
+_BATCH_SIZE = 500
+
+
+def _chunks(values):
+    for start in range(0, len(values), _BATCH_SIZE):
+        yield values[start:start + _BATCH_SIZE]
+
+
+class QuarantineStore:
+    """隔离区元数据存储
+
+    使用 SQLite（WAL 模式）保存隔离记录，以隔离 ID 为主键，并按原路径与隔离时间建立索引，
+    查找、恢复与删除单个项目都不需要读取或重写全部记录。
+    隔离内容按 SHA-256 存储为压缩数据块（blobs 表记录引用计数），相同内容只保存一份；
+    旧版本直接移动到隔离区的项目 sha256 为 NULL，quarantine_path 即隔离文件。
+    journal 表记录进行中的隔离操作（移动文件之前写入），用于启动时继续或撤销被中断的操作。
+    accessed 为最近使用时间（隔离、再次隔离相同内容或按 ID 查找时更新），供保留策略按 LRU 顺序删除。
+    """
+
+    SCHEMA_VERSION = 4
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # 隔离日志必须在移动文件之前落盘
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'id TEXT PRIMARY KEY, file_name TEXT NOT NULL, original_path TEXT NOT NULL, '
+            'quarantine_path TEXT NOT NULL, quarantine_time TEXT NOT NULL, created REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_original_path ON items (original_path)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_created ON items (created)')
+        self._upgrade()
+        self.conn.commit()
+
+    def _upgrade(self):
+        """按 user_version 升级表结构"""
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < 2:
+            # 内容寻址存储：隔离项目引用数据块，并保存原文件的权限与时间
+            columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(items)')}
+            for column, kind in (('sha256', 'TEXT'), ('size', 'INTEGER'), ('mode', 'INTEGER'),
+                                 ('atime_ns', 'INTEGER'), ('mtime_ns', 'INTEGER')):
+                if column not in columns:
+                    self.conn.execute(f'ALTER TABLE items ADD COLUMN {column} {kind}')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_sha256 ON items (sha256)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, stored_size INTEGER NOT NULL, '
+                'codec TEXT NOT NULL, refcount INTEGER NOT NULL)'
+            )
+        if version < 3:
+            # state: intent 已记录、尚未移出原位置；staged 已移入暂存区、尚未保存为数据块
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS journal ('
+                'op_id TEXT PRIMARY KEY, item_id TEXT NOT NULL, state TEXT NOT NULL, file_name TEXT NOT NULL, '
+                'original_path TEXT NOT NULL, staging_path TEXT NOT NULL, quarantine_time TEXT NOT NULL, '
+                'mode INTEGER NOT NULL, atime_ns INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, created REAL NOT NULL)'
+            )
+        if version < 4:
+            columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(items)')}
+            if 'accessed' not in columns:
+                self.conn.execute('ALTER TABLE items ADD COLUMN accessed REAL')
+            self.conn.execute('UPDATE items SET accessed = created WHERE accessed IS NULL')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_accessed ON items (accessed)')
+        self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _to_item(row):
+        """数据库行转换为隔离项目字典（file_path 为原路径）"""
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'quarantine_time': row['quarantine_time'],
+            'file_name': row['file_name'],
+            'file_path': row['original_path'],
+            'quarantine_path': row['quarantine_path'],
+            'created': row['created'],
+            'sha256': row['sha256'],
+            'size': row['size'],
+            'mode': row['mode'],
+            'atime_ns': row['atime_ns'],
+            'mtime_ns': row['mtime_ns'],
+        }
+
+    def add_blob_item(self, item_id, file_name, original_path, quarantine_time, blob_path, sha256, size,
+                      stored_size, codec, mode, atime_ns, mtime_ns, op_id=None):
+        """在一个事务中添加引用数据块的隔离项目，并增加数据块的引用计数；指定 op_id 时同时结束该隔离操作
+
+        再次隔离相同内容时，引用同一数据块的已有项目的最近使用时间一并更新。
+        """
+        now = time.time()
+        with self.conn:
+            if op_id is not None:
+                self.conn.execute('DELETE FROM journal WHERE op_id = ?', (op_id,))
+            self.conn.execute(
+                'INSERT OR IGNORE INTO blobs (sha256, size, stored_size, codec, refcount) VALUES (?, ?, ?, ?, 0)',
+                (sha256, size, stored_size, codec)
+            )
+            self.conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,))
+            self.conn.execute('UPDATE items SET accessed = ? WHERE sha256 = ?', (now, sha256))
+            self.conn.execute(
+                'INSERT INTO items (id, file_name, original_path, quarantine_path, quarantine_time, created, '
+                'accessed, sha256, size, mode, atime_ns, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (item_id, file_name, original_path, blob_path, quarantine_time, now, now,
+                 sha256, size, mode, atime_ns, mtime_ns)
+            )
+        return item_id
+
+    def begin_operation(self, op_id, item_id, file_name, original_path, staging_path, quarantine_time,
+                        mode, atime_ns, mtime_ns):
+        """记录隔离意图（状态 intent），必须在移动原文件之前提交"""
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO journal (op_id, item_id, state, file_name, original_path, staging_path, quarantine_time, '
+                'mode, atime_ns, mtime_ns, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (op_id, item_id, 'intent', file_name, original_path, staging_path, quarantine_time,
+                 mode, atime_ns, mtime_ns, time.time())
+            )
+
+    def mark_staged(self, op_id):
+        """原文件已移入暂存区"""
+        with self.conn:
+            self.conn.execute("UPDATE journal SET state = 'staged' WHERE op_id = ?", (op_id,))
+
+    def end_operation(self, op_id):
+        """撤销或放弃隔离操作"""
+        with self.conn:
+            self.conn.execute('DELETE FROM journal WHERE op_id = ?', (op_id,))
+
+    def operations(self):
+        """未完成的隔离操作"""
+        return [dict(row) for row in self.conn.execute('SELECT * FROM journal ORDER BY created')]
+
+    def get(self, item_id):
+        row = self.conn.execute('SELECT * FROM items WHERE id = ?', (item_id,)).fetchone()
+        return self._to_item(row)
+
+    def get_many(self, item_ids):
+        """批量查询，返回 {隔离 ID: 项目}，不存在的 ID 不包含在结果中"""
+        items = {}
+        for chunk in _chunks(list(item_ids)):
+            placeholders = ','.join('?' * len(chunk))
+            for row in self.conn.execute(f'SELECT * FROM items WHERE id IN ({placeholders})', chunk):
+                items[row['id']] = self._to_item(row)
+        return items
+
+    def find_by_path(self, original_path):
+        """按原路径精确查找，同一路径隔离过多次时返回最近的一次"""
+        row = self.conn.execute(
+            'SELECT * FROM items WHERE original_path = ? ORDER BY created DESC LIMIT 1', (original_path,)
+        ).fetchone()
+        return self._to_item(row)
+
+    def touch(self, item_id):
+        """更新最近使用时间"""
+        with self.conn:
+            self.conn.execute('UPDATE items SET accessed = ? WHERE id = ?', (time.time(), item_id))
+
+    def total_bytes(self):
+        """隔离区占用的字节数：数据块的压缩后大小之和（旧版项目的大小未知，不计入）"""
+        return self.conn.execute(
+            'SELECT (SELECT COALESCE(SUM(stored_size), 0) FROM blobs) + '
+            '(SELECT COALESCE(SUM(size), 0) FROM items WHERE sha256 IS NULL)'
+        ).fetchone()[0]
+
+    def eviction_candidates(self, order, limit, before=None):
+        """按 order（created 隔离时间或 accessed 最近使用时间）从旧到新返回最多 limit 个待删除项目
+
+        before 不为 None 时只返回隔离时间早于 before 的项目。
+        每项包含 id、sha256、quarantine_path、size 以及数据块的 stored_size 与 refcount（旧版项目为 None）。
+        """
+        if order not in ('created', 'accessed'):
+            raise ValueError(f'unknown eviction order: {order}')
+        where = 'WHERE items.created < ?' if before is not None else ''
+        params = (before, limit) if before is not None else (limit,)
+        rows = self.conn.execute(
+            'SELECT items.id, items.sha256, items.quarantine_path, items.size, blobs.stored_size, blobs.refcount '
+            f'FROM items LEFT JOIN blobs ON blobs.sha256 = items.sha256 {where} '
+            f'ORDER BY items.{order}, items.id LIMIT ?',
+            params
+        )
+        return [dict(row) for row in rows]
+
+    def remove_many(self, item_ids):
+        """在一个事务中删除多条记录并减少数据块的引用计数
+
+        返回引用计数降为 0 的数据块 SHA-256 列表（其记录已删除），调用方在提交后删除对应文件。
+        """
+        orphans = []
+        with self.conn:
+            for chunk in _chunks(list(item_ids)):
+                placeholders = ','.join('?' * len(chunk))
+                released = [row[0] for row in self.conn.execute(
+                    f'SELECT sha256 FROM items WHERE id IN ({placeholders}) AND sha256 IS NOT NULL', chunk)]
+                self.conn.execute(f'DELETE FROM items WHERE id IN ({placeholders})', chunk)
+                for sha256 in released:
+                    self.conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+                for sha256 in set(released):
+                    row = self.conn.execute('SELECT refcount FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+                    if row and row[0] <= 0:
+                        self.conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+                        orphans.append(sha256)
+        return orphans
+
+    def items(self):
+        """按隔离时间顺序返回全部项目"""
+        return [self._to_item(row) for row in self.conn.execute('SELECT * FROM items ORDER BY created, id')]
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute('DELETE FROM items')
+            self.conn.execute('DELETE FROM blobs')
+            self.conn.execute('DELETE FROM journal')
+
+    def import_log(self, log_path):
+        """导入旧版 quarantine.log（每行：隔离时间,文件名,原路径,隔离路径），返回导入的记录数
+
+        在一个事务中完成；记录 ID 由行内容确定，重复导入同一日志不会产生重复记录。
+        """
+        rows = []
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f):
+                parts = line.rstrip('\n').split(',', 3)
+                if len(parts) != 4:
+                    continue
+                quarantine_time, file_name, original_path, quarantine_path = parts
+                try:
+                    created = time.mktime(time.strptime(quarantine_time, '%Y%m%d_%H%M%S'))
+                except ValueError:
+                    created = 0.0
+                item_id = uuid.uuid5(_LOG_NAMESPACE, f'{number}:{line}').hex
+                rows.append((item_id, file_name, original_path, quarantine_path, quarantine_time, created, created))
+        with self.conn:
+            cursor = self.conn.executemany(
+                'INSERT OR IGNORE INTO items (id, file_name, original_path, quarantine_path, quarantine_time, created, '
+                'accessed) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
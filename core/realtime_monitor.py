@@ -0,0 +1,368 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from core.file_walker import FileWalker
+from core.trust_trie import TrustTrie
+
+# inotify 常量（linux/inotify.h）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+               | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+# fanotify 常量（linux/fanotify.h）
+FAN_CLOSE_WRITE = 0x00000008
+FAN_Q_OVERFLOW = 0x00004000
+FAN_CLOEXEC = 0x00000001
+FAN_NONBLOCK = 0x00000002
+FAN_CLASS_NOTIF = 0x00000000
+FAN_MARK_ADD = 0x00000001
+FAN_MARK_MOUNT = 0x00000010
+FAN_NOFD = -1
+AT_FDCWD = -100
+_FANOTIFY_EVENT = struct.Struct('IBBHQii')
+
+# 每次从内核读取事件的缓冲区大小，较大的缓冲区可以在突发写入时尽快清空内核队列
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+def _default_max_watches():
+    """默认监视数上限：系统允许值的一半，为其他程序保留余量"""
+    try:
+        with open('/proc/sys/fs/inotify/max_user_watches', 'r') as f:
+            return max(int(f.read()) // 2, 1024)
+    except (OSError, ValueError):
+        return 8192
+
+
+class RealtimeMonitor:
+    """实时防护监视器（仅 Linux）
+
+    监视指定目录中新建、写入后关闭以及移入的文件，去抖后交给扫描引擎扫描。
+    优先使用 fanotify 按挂载点监视（需要 CAP_SYS_ADMIN，内存占用与目录数量无关），
+    无权限时退回 inotify 按目录监视，监视数量不超过 max_watches。
+    读取线程只负责解析事件并合并到待扫描队列，扫描在独立线程中进行，
+    同一文件在去抖时间内的多次事件只扫描一次。
+    """
+
+    def __init__(self, engine, paths, threat_callback=None, debounce=0.5,
+                 max_watches=None, max_pending=100000, use_fanotify=True):
+        self.engine = engine
+        self.paths = [os.path.realpath(path) for path in paths]
+        self.threat_callback = threat_callback
+        self.debounce = debounce
+        self.max_watches = max_watches or _default_max_watches()
+        self.max_pending = max_pending
+        self.use_fanotify = use_fanotify
+        self.backend = None
+        self.events_received = 0
+        self.files_scanned = 0
+        self.threats_found = 0
+        self.watch_limit_reached = False
+        self.overflows = 0
+        self._path_set = TrustTrie(self.paths)
+        self._fd = -1
+        self._libc = None
+        self._watches = {}
+        self._renamed = set()
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._rescanning = threading.Event()
+        self._threads = []
+
+    # ---- 启动与停止 ----
+
+    def start(self):
+        """开始监视"""
+        self._libc = _load_libc()
+        if not (self.use_fanotify and self._start_fanotify()):
+            self._start_inotify()
+        self._threads = [
+            threading.Thread(target=self._read_loop, name='realtime-reader', daemon=True),
+            threading.Thread(target=self._scan_loop, name='realtime-scanner', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """停止监视"""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._watches.clear()
+        self._renamed.clear()
+
+    def request_stop(self):
+        """通知 run_forever 退出（可在信号处理函数中调用）"""
+        self._stop.set()
+
+    def run_forever(self):
+        """阻塞运行，直到 request_stop 被调用"""
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        finally:
+            self.stop()
+
+    def _start_fanotify(self):
+        """尝试使用 fanotify 监视挂载点，无权限或不支持时返回 False"""
+        libc = self._libc
+        try:
+            fanotify_init = libc.fanotify_init
+            fanotify_mark = libc.fanotify_mark
+        except AttributeError:
+            return False
+        fanotify_init.argtypes = [ctypes.c_uint, ctypes.c_uint]
+        fanotify_mark.argtypes = [ctypes.c_int, ctypes.c_uint, ctypes.c_uint64, ctypes.c_int, ctypes.c_char_p]
+        fd = fanotify_init(FAN_CLASS_NOTIF | FAN_CLOEXEC | FAN_NONBLOCK, os.O_RDONLY | getattr(os, 'O_LARGEFILE', 0))
+        if fd < 0:
+            return False
+        for path in self.paths:
+            if fanotify_mark(fd, FAN_MARK_ADD | FAN_MARK_MOUNT, FAN_CLOSE_WRITE, AT_FDCWD, os.fsencode(path)) < 0:
+                os.close(fd)
+                return False
+        self._fd = fd
+        self.backend = 'fanotify'
+        return True
+
+    def _start_inotify(self):
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self.backend = 'inotify'
+        for path in self.paths:
+            self._watch_tree(path, scan_existing=False)
+
+    # ---- inotify 监视管理 ----
+
+    def _add_watch(self, directory):
+        """添加目录监视
+
+        已监视的目录在监视范围内改名后，内核对新路径返回原有的 wd，
+        此时改用新路径并同步更新其下子目录的路径，随后的 IN_MOVE_SELF 不再移除该监视。
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            if ctypes.get_errno() == errno.ENOSPC:
+                self.watch_limit_reached = True
+            return False
+        previous = self._watches.get(wd)
+        if previous is None:
+            if len(self._watches) >= self.max_watches:
+                self.watch_limit_reached = True
+                self._libc.inotify_rm_watch(self._fd, wd)
+                return False
+        elif previous != directory:
+            prefix = previous + os.sep
+            for child_wd, path in self._watches.items():
+                if path.startswith(prefix):
+                    self._watches[child_wd] = directory + path[len(previous):]
+            self._renamed.add(wd)
+        self._watches[wd] = directory
+        return True
+
+    def _remove_tree_watches(self, wd, directory):
+        """目录被移出监视范围：移除它及其下子目录的监视（IN_IGNORED 到达时从表中删除）"""
+        prefix = directory + os.sep
+        for child_wd, path in list(self._watches.items()):
+            if child_wd == wd or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, child_wd)
+
+    def _watch_tree(self, root, scan_existing):
+        """为目录树添加监视；scan_existing 为 True 时同时扫描其中已有的文件
+
+        新建目录在添加监视之前可能已经写入了文件，因此需要补扫。
+        """
+        is_excluded = self.engine._is_excluded
+        if is_excluded(root) or not self._add_watch(root):
+            return
+        stack = [root]
+        while stack and not self._stop.is_set():
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not is_excluded(entry.path) and self._add_watch(entry.path):
+                                    stack.append(entry.path)
+                            elif scan_existing and entry.is_file():
+                                self._enqueue(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    # ---- 事件读取 ----
+
+    def _read_loop(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while not self._stop.is_set():
+            if not poller.poll(200):
+                continue
+            try:
+                data = os.read(self._fd, READ_BUFFER_SIZE)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            if self.backend == 'fanotify':
+                self._handle_fanotify(data)
+            else:
+                self._handle_inotify(data)
+
+    def _handle_inotify(self, data):
+        offset = 0
+        size = _INOTIFY_EVENT.size
+        while offset + size <= len(data):
+            wd, mask, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + size:offset + size + name_len].rstrip(b'\0')
+            offset += size + name_len
+            self.events_received += 1
+
+            if mask & IN_Q_OVERFLOW:
+                self._overflow()
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                self._renamed.discard(wd)
+                continue
+            if mask & IN_DELETE_SELF:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                continue
+            if mask & IN_MOVE_SELF:
+                # 在监视范围内改名的目录已由 IN_MOVED_TO 更新路径，只移除被移出范围的目录
+                if wd in self._renamed:
+                    self._renamed.discard(wd)
+                else:
+                    self._remove_tree_watches(wd, directory)
+                continue
+            if not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path, scan_existing=True)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._enqueue(path)
+
+    def _handle_fanotify(self, data):
+        offset = 0
+        size = _FANOTIFY_EVENT.size
+        while offset + size <= len(data):
+            event_len, _, _, _, mask, fd, _ = _FANOTIFY_EVENT.unpack_from(data, offset)
+            if event_len < size:
+                break
+            offset += event_len
+            self.events_received += 1
+            if mask & FAN_Q_OVERFLOW:
+                self._overflow()
+            if fd == FAN_NOFD or fd < 0:
+                continue
+            try:
+                path = os.readlink(f'/proc/self/fd/{fd}')
+            except OSError:
+                path = None
+            finally:
+                os.close(fd)
+            # fanotify 按挂载点监视，只处理配置目录中的文件
+            if path and self._path_set.is_trusted(path):
+                self._enqueue(path)
+
+    def _overflow(self):
+        """内核事件队列溢出：无法得知丢失了哪些事件，补扫所有监视目录"""
+        self.overflows += 1
+        if self._rescanning.is_set():
+            return
+        self._rescanning.set()
+        threading.Thread(target=self._rescan, name='realtime-rescan', daemon=True).start()
+
+    def _rescan(self):
+        try:
+            for entry in FileWalker(self.paths, prune=self.engine._is_excluded):
+                if self._stop.is_set():
+                    return
+                self._enqueue(entry.path)
+        finally:
+            self._rescanning.clear()
+
+    # ---- 去抖与扫描 ----
+
+    def _enqueue(self, path):
+        """加入待扫描队列；同一路径重复出现时推迟其扫描时间"""
+        deadline = time.monotonic() + self.debounce
+        with self._condition:
+            if path in self._pending:
+                self._pending.move_to_end(path)
+            elif len(self._pending) >= self.max_pending:
+                # 队列已满时等待扫描线程腾出空间，不丢弃事件
+                while len(self._pending) >= self.max_pending and not self._stop.is_set():
+                    self._condition.wait(0.1)
+            self._pending[path] = deadline
+            self._condition.notify_all()
+
+    def _scan_loop(self):
+        while not self._stop.is_set():
+            with self._condition:
+                if not self._pending:
+                    self._condition.wait(0.5)
+                    continue
+                path, deadline = next(iter(self._pending.items()))
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                del self._pending[path]
+                self._condition.notify_all()
+            self._scan(path)
+
+    def _scan(self, path):
+        if self.engine._is_excluded(path) or not os.path.isfile(path):
+            return
+        item = self.engine._check_file(path)
+        self.files_scanned += 1
+        if item.threat:
+            self.threats_found += 1
+            if self.threat_callback:
+                self.threat_callback.emit({'path': item.threat_path, 'threat': item.threat})
@@ -0,0 +1,170 @@
+"""命令行扫描入口（不依赖 PyQt5）
+
+用法示例:
+    python -m core.scan_cli /data /home --workers 8
+    python -m core.scan_cli --mode quick
+    python -m core.scan_cli /home --watch      # 实时防护（仅 Linux），Ctrl+C 退出
+
+每发现一个威胁输出一行 JSON，扫描结束输出一行汇总 JSON。
+不存在或无法读取的扫描路径输出到标准错误，并记录在汇总的 target_errors 中。
+退出码: 0 未发现威胁，1 发现威胁，2 参数错误或扫描路径不存在/无法读取，130 扫描被中断。
+"""
+import argparse
+import json
+import signal
+import sys
+import time
+
+from core.archive_scanner import ArchiveScanner
+from core.scan_control import ScanControl
+from core.scan_engine import ScanEngine
+from core.scan_throttle import ScanThrottle
+
+
+class JsonLinesWriter:
+    """以 JSON Lines 格式输出到标准输出"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def emit(self, record):
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+
+class _FindingWriter(JsonLinesWriter):
+    """输出威胁记录"""
+
+    def emit(self, finding):
+        super().emit({'type': 'finding', **finding})
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m core.scan_cli', description='极速云杀毒命令行扫描')
+    parser.add_argument('targets', nargs='*', help='扫描路径（custom 模式）')
+    parser.add_argument('--mode', choices=['custom', 'quick', 'full'],
+                        help='扫描模式，指定路径时默认为 custom，否则为 quick')
+    parser.add_argument('--workers', type=int, default=1, help='扫描进程数')
+    parser.add_argument('--queue-depth', type=int, default=None, help='并行模式下同时提交的批次数')
+    parser.add_argument('--batch-size', type=int, default=64, help='每个批次的文件数')
+    parser.add_argument('--async-io', type=int, default=0, metavar='N',
+                        help='异步模式：最多同时进行 N 个目录列出与文件读取操作（适合 NFS/SMB 等网络文件系统）')
+    parser.add_argument('--mount-concurrency', type=int, default=64, help='异步模式下每个挂载点同时进行的操作数上限')
+    parser.add_argument('--cache', default='scan_cache.db', help='扫描结果缓存文件')
+    parser.add_argument('--no-cache', action='store_true', help='不使用扫描结果缓存')
+    parser.add_argument('--files-per-sec', type=float, default=None, help='每秒扫描文件数上限')
+    parser.add_argument('--bytes-per-sec', type=float, default=None, help='每秒读取字节数上限')
+    parser.add_argument('--background', action='store_true', help='系统繁忙时自动降低扫描速度')
+    parser.add_argument('--archive-depth', type=int, default=3, help='压缩包嵌套扫描层数，0 表示不扫描压缩包内容')
+    parser.add_argument('--one-file-system', action='store_true', help='不跨越文件系统遍历目录')
+    parser.add_argument('--include-pseudo-fs', action='store_true', help='full 模式下包含 /proc、/sys 等伪文件系统')
+    parser.add_argument('--include-remote-fs', action='store_true', help='full 模式下包含网络文件系统')
+    parser.add_argument('--stats', action='store_true', help='记录各阶段耗时与计数，并输出到汇总的 stats 字段')
+    parser.add_argument('--metrics-file', help='扫描期间定期写入 Prometheus 文本格式指标的文件（如 node_exporter textfile 目录下的 .prom 文件）')
+    parser.add_argument('--metrics-interval', type=float, default=15.0, help='写入指标文件的间隔（秒）')
+    parser.add_argument('--watch', action='store_true', help='实时监视指定路径，扫描新写入的文件')
+    parser.add_argument('--debounce', type=float, default=0.5, help='实时监视的去抖时间（秒）')
+    return parser
+
+
+def watch(engine, targets, debounce):
+    """实时监视，直到收到 SIGINT/SIGTERM"""
+    from core.realtime_monitor import RealtimeMonitor
+
+    monitor = RealtimeMonitor(engine, targets, _FindingWriter(), debounce=debounce)
+
+    def _stop(signum, frame):
+        monitor.request_stop()
+    signal.signal(signal.SIGINT, _stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, _stop)
+
+    start = time.monotonic()
+    monitor.run_forever()
+    JsonLinesWriter().emit({
+        'type': 'summary',
+        'mode': 'watch',
+        'backend': monitor.backend,
+        'events': monitor.events_received,
+        'scanned': monitor.files_scanned,
+        'threats': monitor.threats_found,
+        'watch_limit_reached': monitor.watch_limit_reached,
+        'overflows': monitor.overflows,
+        'elapsed': round(time.monotonic() - start, 3),
+    })
+    return 1 if monitor.threats_found else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    mode = args.mode or ('custom' if args.targets else 'quick')
+    if mode == 'custom' and not args.targets:
+        print('custom 模式需要指定扫描路径', file=sys.stderr)
+        return 2
+
+    if args.background:
+        throttle = ScanThrottle(args.bytes_per_sec, args.files_per_sec, load_threshold=1.0, disk_busy_threshold=0.8)
+    else:
+        throttle = ScanThrottle(args.bytes_per_sec, args.files_per_sec)
+
+    if args.watch:
+        if not args.targets:
+            print('--watch 需要指定监视路径', file=sys.stderr)
+            return 2
+        engine = ScanEngine(cache_path=None, throttle=throttle)
+        return watch(engine, args.targets, args.debounce)
+
+    control = ScanControl()
+    engine = ScanEngine(workers=args.workers, queue_depth=args.queue_depth, batch_size=args.batch_size,
+                        cache_path=None if args.no_cache else args.cache,
+                        throttle=throttle, control=control,
+                        archive_scanner=ArchiveScanner(max_depth=args.archive_depth),
+                        metrics=args.stats, metrics_path=args.metrics_file, metrics_interval=args.metrics_interval,
+                        io_concurrency=args.async_io, mount_concurrency=args.mount_concurrency)
+
+    # Ctrl+C / SIGTERM 时停止扫描并输出已完成部分的汇总
+    def _stop(signum, frame):
+        control.cancel()
+    signal.signal(signal.SIGINT, _stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, _stop)
+
+    findings = _FindingWriter()
+    start = time.monotonic()
+    if mode == 'quick':
+        threats = engine.quick_scan(threat_callback=findings)
+    elif mode == 'full':
+        threats = engine.full_scan(threat_callback=findings, one_file_system=args.one_file_system,
+                                   include_pseudo=args.include_pseudo_fs, include_remote=args.include_remote_fs)
+    else:
+        threats = engine.custom_scan(args.targets, threat_callback=findings,
+                                     one_file_system=args.one_file_system)
+
+    summary = {
+        'type': 'summary',
+        'mode': mode,
+        'scanned': engine.scan_count,
+        'threats': len(threats),
+        'errors': engine.scan_errors,
+        'target_errors': engine.target_errors,
+        'cache_hits': engine.cache_hits,
+        'file_types': engine.type_counts,
+        'bytes_skipped': engine.bytes_skipped,
+        'cancelled': engine.cancelled,
+        'elapsed': round(time.monotonic() - start, 3),
+    }
+    if args.stats:
+        summary['stats'] = engine.stats()
+    JsonLinesWriter().emit(summary)
+    for target in engine.target_errors:
+        print(f"无法扫描 {target['path']}: {target['error']}", file=sys.stderr)
+
+    if engine.cancelled:
+        return 130
+    if threats:
+        return 1
+    return 2 if engine.target_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
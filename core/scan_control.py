@@ -0,0 +1,49 @@
+import multiprocessing
+
+
+class ScanCancelled(Exception):
+    """扫描被取消"""
+
+
+class ScanControl:
+    """扫描控制令牌
+
+    扫描引擎在文件之间以及大文件的分块之间调用 checkpoint：
+    暂停时在原地等待（保留遍历与工作进程状态），取消时抛出 ScanCancelled。
+    内部使用进程间事件，可随扫描引擎传入工作进程。
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context('spawn')
+        self._cancel_event = context.Event()
+        self._run_event = context.Event()
+        self._run_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self._run_event.is_set()
+
+    def cancel(self):
+        """取消扫描（同时唤醒暂停中的扫描）"""
+        self._cancel_event.set()
+        self._run_event.set()
+
+    def pause(self):
+        """暂停扫描"""
+        if not self.cancelled:
+            self._run_event.clear()
+
+    def resume(self):
+        """继续扫描"""
+        self._run_event.set()
+
+    def checkpoint(self):
+        """取消点：暂停时阻塞等待，已取消时抛出 ScanCancelled"""
+        if not self._run_event.is_set():
+            self._run_event.wait()
+        if self._cancel_event.is_set():
+            raise ScanCancelled()
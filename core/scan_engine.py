@@ -1,14 +1,188 @@
+import errno
+import hashlib
+import multiprocessing
 import os
+import signal
+import sqlite3
+import stat
 import time
-from utils.file_utils import get_system_directories
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from core.archive_scanner import ArchiveScanner
+from core.file_type import SNIFF_SIZE, sniff_file_type
+from core.file_walker import FileWalker
+from core.hash_blocklist import HashBlocklist, hash_buffer
+from core.scan_control import ScanCancelled
+from core.scan_metrics import PrometheusTextfileWriter, ScanMetrics, error_name
+from core.scan_reporter import ScanReporter
+from core.scan_throttle import ScanThrottle
+from core.signature_matcher import SignatureMatcher
+from core.trust_trie import TrustTrie
+from core.verdict_cache import VerdictCache
+from utils.file_utils import get_full_scan_roots, get_system_directories
+
+# 工作进程内的扫描引擎实例
+_worker_engine = None
+
+
+def _init_worker(engine):
+    """工作进程初始化：保存主进程传入的扫描引擎，限速额度按进程数均分
+
+    终端 Ctrl+C 会发给整个进程组，工作进程忽略 SIGINT，由主进程通过 control 取消扫描。
+    """
+    global _worker_engine
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    engine.throttle = engine.throttle.partition(engine.workers)
+    _worker_engine = engine
+
+
+def _scan_batch(paths):
+    """工作进程中执行读取与检测阶段，按输入顺序返回填写了检测结果的 ScanItem"""
+    return [_worker_engine._throttled_check(file_path) for file_path in paths]
+
+
+class ScanItem:
+    """扫描流水线中的一个文件"""
+    
+    __slots__ = ('path', 'entry', 'key', 'cached', 'threat', 'member', 'scanned', 'file_type', 'size',
+                 'bytes_skipped', 'error', 'timings', 'incomplete')
+    
+    def __init__(self, path, entry=None):
+        self.path = path
+        self.entry = entry
+        self.key = None
+        self.cached = False
+        self.threat = None
+        self.member = None
+        self.scanned = False
+        self.file_type = None
+        self.size = 0
+        # 因文件类型没有适用特征而跳过特征匹配的字节数
+        self.bytes_skipped = 0
+        # 读取失败时的 errno 名称
+        self.error = None
+        # 启用指标时记录 (打开, 读取文件头, 检测) 三个阶段的耗时
+        self.timings = None
+        # 容器扫描因超过限制而未完成，结果不写入缓存
+        self.incomplete = False
+    
+    def update_from(self, result):
+        """复制检测结果（工作进程返回的 ScanItem）"""
+        self.threat = result.threat
+        self.member = result.member
+        self.scanned = result.scanned
+        self.file_type = result.file_type
+        self.size = result.size
+        self.bytes_skipped = result.bytes_skipped
+        self.error = result.error
+        self.timings = result.timings
+        self.incomplete = result.incomplete
+    
+    @property
+    def threat_path(self):
+        """威胁所在路径，容器内的成员以 容器!成员 表示"""
+        return f"{self.path}!{self.member}" if self.member else self.path
+
+
+class StreamDetector:
+    """流式检测器：逐块送入数据，同时进行特征匹配与哈希计算（用于容器成员）"""
+    
+    def __init__(self, engine, file_type=None):
+        self.engine = engine
+        # 已知文件类型时直接选择适用的特征，否则根据第一块数据判断
+        self.sniffed = file_type is not None
+        self.matcher = engine.matcher.for_type(file_type) if self.sniffed else None
+        self.hashers = {blocklist.algorithm: hashlib.new(blocklist.algorithm)
+                        for blocklist in engine.hash_blocklists}
+        self.state = 0
+    
+    def update(self, data):
+        """送入一块数据，特征命中时返回威胁名称"""
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        if not self.sniffed:
+            # 第一块数据即成员的文件头，据此选择适用的特征
+            self.sniffed = True
+            self.matcher = self.engine.matcher.for_type(sniff_file_type(bytes(data[:SNIFF_SIZE])))
+        if self.matcher:
+            self.state, found = self.matcher.feed(data, self.state)
+            if found >= 0:
+                # 命中后不再匹配，后续数据只用于计算哈希
+                matcher, self.matcher = self.matcher, None
+                return matcher.names[found]
+        return None
+    
+    def finish(self):
+        """数据送入完毕，查询哈希黑名单"""
+        digests = {name: hasher.digest() for name, hasher in self.hashers.items()}
+        return self.engine._match_digests(digests)
+
 
 class ScanEngine:
-    """扫描引擎"""
+    """扫描引擎
+
+    扫描按流水线进行：枚举 → 过滤 → 读取/检测 → 报告。
+    各扫描模式只负责提供扫描目标；filters 与 detectors 为可扩展的过滤器与检测器列表。
+    """
+    
+    # 无法获取大小的文件（如 /proc 下的文件）最多读取的字节数
+    MAX_UNSIZED_READ = 16 * 1024 * 1024
+    
+    # 读取文件内容的块大小
+    READ_CHUNK_SIZE = 1024 * 1024
     
-    def __init__(self):
+    def __init__(self, workers=1, queue_depth=None, batch_size=64, cache_path='scan_cache.db',
+                 hash_blocklist_paths=('hash_blocklist.db', 'hash_blocklist_md5.db'), throttle=None,
+                 control=None, archive_scanner=None, metrics=False, metrics_path=None, metrics_interval=15.0,
+                 io_concurrency=0, mount_concurrency=64):
+        """
+        workers: 扫描进程数，大于 1 时启用多进程并行扫描
+        queue_depth: 并行模式下最多同时提交的文件批次数，默认 workers * 4
+        batch_size: 每个批次包含的文件数
+        cache_path: 扫描结果缓存文件，为 None 时不使用缓存
+        hash_blocklist_paths: 哈希黑名单文件列表，不存在的文件会被忽略
+        throttle: 扫描限速器 ScanThrottle，为 None 时不限速
+        control: 扫描控制令牌 ScanControl，用于暂停、继续与取消扫描
+        archive_scanner: 容器文件扫描器 ArchiveScanner，为 None 时使用默认限制，max_depth=0 时不扫描容器内容
+        metrics: 是否记录各阶段耗时直方图、计数器与队列深度（见 stats()），未启用时几乎没有开销
+        metrics_path: 扫描期间每 metrics_interval 秒以 Prometheus 文本格式写入该文件，指定时自动启用 metrics
+        io_concurrency: 大于 0 时使用异步模式（适合 NFS/SMB 等高延迟文件系统）：目录列出与文件检测
+            在 io_concurrency 个线程中并发进行，同一挂载点同时进行的操作不超过 mount_concurrency 个；
+            异步模式下不使用 workers 指定的多进程
+        """
         self.scan_count = 0
         self.threats_found = 0
+        self.cache_hits = 0
+        # 无法读取、未完成检测的文件数
+        self.scan_errors = 0
+        # 不存在或无法读取的扫描路径
+        self.target_errors = []
+        self.cancelled = False
+        self.type_counts = {}
+        self.bytes_skipped = 0
+        self.cache_path = cache_path
+        self.workers = max(int(workers or 1), 1)
+        self.queue_depth = max(int(queue_depth or self.workers * 4), 1)
+        self.batch_size = max(int(batch_size), 1)
+        self.throttle = throttle or ScanThrottle.unthrottled()
+        self.control = control
+        self._checkpoint = control.checkpoint if control else None
+        self.archive_scanner = archive_scanner or ArchiveScanner()
+        self.metrics = ScanMetrics() if metrics or metrics_path else None
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.io_concurrency = max(int(io_concurrency or 0), 0)
+        self.mount_concurrency = max(int(mount_concurrency), 1)
         self.trust_paths = self._load_trust_paths()
+        self.trust_trie = TrustTrie(self.trust_paths)
+        self.matcher = self._load_signatures()
+        self.hash_blocklists = self._load_hash_blocklists(hash_blocklist_paths)
+        # 过滤器：filter(路径) 返回 True 表示排除该文件或目录（目录被排除时整棵子树不再遍历）
+        self.filters = [self._is_trusted]
+        # 检测器：detector(文件内容, 取消点, 文件类型) 返回威胁名称或 None，按顺序执行，命中即停止
+        # 只有内置检测器时按块流式检测；添加了其他检测器时文件内容整体读入内存
+        self.detectors = [self._detect_hash, self._detect_signatures]
     
     def _load_trust_paths(self):
         """加载信任路径"""
@@ -18,143 +192,503 @@ class ScanEngine:
         except FileNotFoundError:
             return []
     
+    def _load_signatures(self):
+        """加载病毒特征库
+
+        优先以 mmap 方式加载编译后的 signatures.db（启动快，工作进程共享页缓存），
+        不存在、无效或比 signatures.txt 旧时加载文本特征库。
+        """
+        try:
+            if not os.path.exists('signatures.txt') or \
+                    os.path.getmtime('signatures.db') >= os.path.getmtime('signatures.txt'):
+                return SignatureMatcher.load('signatures.db')
+        except (OSError, ValueError):
+            pass
+        try:
+            return SignatureMatcher.from_file('signatures.txt')
+        except FileNotFoundError:
+            return SignatureMatcher([])
+    
+    def _load_hash_blocklists(self, paths):
+        """加载哈希黑名单"""
+        blocklists = []
+        for path in paths or ():
+            try:
+                blocklists.append(HashBlocklist(path))
+            except (OSError, ValueError):
+                continue
+        return blocklists
+    
+    def _signature_version(self):
+        """特征库、哈希黑名单与容器扫描设置的组合版本，用于判断缓存结果是否仍然有效"""
+        versions = [self.matcher.version] + [blocklist.version for blocklist in self.hash_blocklists]
+        versions.append(self.archive_scanner.version)
+        return '-'.join(versions)
+    
+    def add_filter(self, file_filter):
+        """添加过滤器（并行模式下需可被 pickle，例如模块级函数）"""
+        self.filters.append(file_filter)
+    
+    def add_detector(self, detector, first=False):
+        """添加检测器，first 为 True 时放在最前面执行"""
+        if first:
+            self.detectors.insert(0, detector)
+        else:
+            self.detectors.append(detector)
+    
     def _is_trusted(self, file_path):
         """检查文件是否在信任区"""
-        for trust_path in self.trust_paths:
-            if file_path.startswith(trust_path):
+        return self.trust_trie.is_trusted(file_path)
+    
+    def _is_excluded(self, path):
+        """检查路径是否被任一过滤器排除"""
+        for file_filter in self.filters:
+            if file_filter(path):
                 return True
         return False
     
+    # ---- 检测器 ----
+    
+    def _detect_hash(self, data, checkpoint=None, file_type=None):
+        """计算文件哈希并查询黑名单，返回命中的威胁名称，未命中返回 None"""
+        if not self.hash_blocklists:
+            return None
+        algorithms = {blocklist.algorithm for blocklist in self.hash_blocklists}
+        return self._match_digests(hash_buffer(data, algorithms, checkpoint))
+    
+    def _match_digests(self, digests):
+        """在哈希黑名单中查询 {算法名: 摘要}"""
+        for blocklist in self.hash_blocklists:
+            if digests[blocklist.algorithm] in blocklist:
+                return f"HashBlocklist.{blocklist.algorithm.upper()}"
+        return None
+    
+    def _detect_signatures(self, data, checkpoint=None, file_type='unknown'):
+        """特征匹配，只使用适用于该文件类型的特征，返回命中的威胁名称，未命中返回 None"""
+        matcher = self.matcher.for_type(file_type)
+        if matcher is None:
+            return None
+        return matcher.scan_buffer(data, checkpoint=checkpoint)
+    
+    # ---- 读取与检测 ----
+    
     def _scan_file(self, file_path):
-        """扫描单个文件"""
-        # 模拟病毒检测
-        # 实际应用中，这里应该使用病毒特征库进行匹配
-        threat_extensions = ['.virus', '.malware', '.trojan']
-        for ext in threat_extensions:
-            if file_path.endswith(ext):
-                return True
-        return False
+        """扫描单个文件，返回命中的威胁名称，未命中返回 None"""
+        return self._check_file(file_path).threat
+    
+    def _check_file(self, file_path):
+        """读取并检测单个文件，返回填写了检测结果的 ScanItem
+
+        先读取文件头判断文件类型，检测器据此选择适用的特征；
+        文件本身未命中且为容器文件时，继续以流的方式检测其中的成员。
+        文件以 readinto 按块读入同一缓冲区（不使用 mmap：扫描期间文件被其他进程截断时
+        只会提前读到文件末尾，不会因访问映射而收到 SIGBUS）。
+        """
+        item = ScanItem(file_path)
+        metrics = self.metrics
+        if metrics:
+            start = time.perf_counter()
+        try:
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                # 大小为 0 的文件可能是 /proc 等无法获取大小的文件
+                limit = size or self.MAX_UNSIZED_READ
+                view = memoryview(bytearray(min(limit, self.READ_CHUNK_SIZE)))
+                if metrics:
+                    opened = time.perf_counter()
+                count = f.readinto(view)
+                head = bytes(view[:min(count, SNIFF_SIZE)])
+                item.file_type = sniff_file_type(head)
+                if metrics:
+                    sniffed = time.perf_counter()
+                if self.detectors == [self._detect_hash, self._detect_signatures]:
+                    item.threat, read = self._detect_stream(f, view, count, limit, item.file_type)
+                    item.size = max(read, size)
+                else:
+                    data = self._read_all(f, view, count, limit)
+                    item.size = len(data)
+                    for detector in self.detectors:
+                        item.threat = detector(data, self._checkpoint, item.file_type)
+                        if item.threat:
+                            break
+                if self.matcher.for_type(item.file_type) is None:
+                    item.bytes_skipped = item.size
+                if not item.threat and self.archive_scanner.enabled:
+                    item.threat, item.member, complete = self.archive_scanner.scan_file(
+                        f, item.size, os.path.basename(file_path), self._stream_detector, self._checkpoint, head)
+                    item.incomplete = not complete
+            item.scanned = True
+            if metrics:
+                item.timings = (opened - start, sniffed - opened, time.perf_counter() - sniffed)
+        except (OSError, ValueError) as e:
+            item.threat = None
+            item.member = None
+            item.error = error_name(getattr(e, 'errno', None))
+        return item
+    
+    def _detect_stream(self, f, view, count, limit, file_type):
+        """内置检测器（哈希黑名单与特征匹配）的流式实现，返回 (威胁名称, 检测的字节数)
+
+        view 中已有 count 字节的第一块数据。两者都命中时与按顺序执行检测器一样，哈希黑名单优先。
+        """
+        checkpoint = self._checkpoint
+        detector = StreamDetector(self, file_type)
+        threat = None
+        total = 0
+        while count:
+            if detector.matcher is None and not detector.hashers:
+                # 没有适用的特征也没有哈希黑名单，不需要读取其余内容
+                return threat, total
+            total += count
+            found = detector.update(view[:count])
+            if found and threat is None:
+                threat = found
+                if not self.hash_blocklists:
+                    return threat, total
+            if total >= limit:
+                break
+            if checkpoint:
+                checkpoint()
+            count = f.readinto(view[:min(len(view), limit - total)])
+        return detector.finish() or threat, total
+    
+    @staticmethod
+    def _read_all(f, view, count, limit):
+        """读取文件全部内容（最多 limit 字节），view 中已有 count 字节的第一块数据"""
+        data = bytearray(view[:count])
+        while count and len(data) < limit:
+            chunk = f.read(min(len(view), limit - len(data)))
+            count = len(chunk)
+            data += chunk
+        return data
+    
+    def _stream_detector(self):
+        return StreamDetector(self)
     
-    def quick_scan(self, progress_callback=None, file_callback=None):
+    def _throttled_check(self, file_path):
+        """扫描单个文件，并按限速器的要求等待"""
+        if not self.throttle.enabled:
+            return self._check_file(file_path)
+        start = time.perf_counter()
+        item = self._check_file(file_path)
+        self.throttle.throttle(item.size, time.perf_counter() - start)
+        return item
+    
+    def _open_cache(self):
+        """打开扫描结果缓存，失败时不使用缓存"""
+        if not self.cache_path:
+            return None
+        try:
+            return VerdictCache(self.cache_path, self._signature_version())
+        except sqlite3.Error:
+            return None
+    
+    # ---- 扫描模式（目标提供者） ----
+    
+    def quick_scan(self, progress_callback=None, file_callback=None, batch_callback=None,
+                   threat_callback=None):
         """快速扫描"""
-        self.scan_count = 0
-        self.threats_found = 0
-        threats = []
-        
-        # 获取系统关键目录
-        system_dirs = get_system_directories()
-        total_files = self._count_files(system_dirs)
-        scanned_files = 0
-        
-        for directory in system_dirs:
-            if os.path.exists(directory):
-                for root, _, files in os.walk(directory):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if not self._is_trusted(file_path):
-                            self.scan_count += 1
-                            scanned_files += 1
-                            
-                            # 更新进度
-                            if progress_callback:
-                                progress = int((scanned_files / total_files) * 100)
-                                progress_callback.emit(min(progress, 100))
-                            
-                            # 回调文件信息
-                            if file_callback:
-                                file_callback.emit(file_path)
-                            
-                            # 扫描文件
-                            if self._scan_file(file_path):
-                                threats.append(file_path)
-                                self.threats_found += 1
-                            
-                            # 模拟扫描延迟
-                            time.sleep(0.01)
-        
-        return threats
+        return self.scan(self._quick_targets(), progress_callback, file_callback, batch_callback, threat_callback)
     
-    def full_scan(self, progress_callback=None, file_callback=None):
-        """完整扫描"""
+    def full_scan(self, progress_callback=None, file_callback=None, batch_callback=None,
+                  threat_callback=None, one_file_system=False, include_pseudo=False, include_remote=False):
+        """完整扫描
+
+        Linux 下按挂载表扫描所有挂载点，默认跳过伪文件系统（/proc、/sys 等）与网络文件系统，
+        include_pseudo / include_remote 为 True 时包含它们；
+        one_file_system 为 True 时每个挂载点只扫描其自身所在的文件系统。
+        """
+        roots, skipped = self._full_targets(include_pseudo, include_remote)
+        return self.scan(roots, progress_callback, file_callback, batch_callback, threat_callback,
+                         one_file_system=one_file_system, skip_paths=skipped)
+    
+    def custom_scan(self, path, progress_callback=None, file_callback=None, batch_callback=None,
+                    threat_callback=None, one_file_system=False):
+        """自定义扫描，path 可以是单个路径或路径列表"""
+        return self.scan(self._custom_targets(path), progress_callback, file_callback, batch_callback,
+                         threat_callback, one_file_system=one_file_system)
+    
+    def _quick_targets(self):
+        """快速扫描目标：系统关键目录"""
+        return get_system_directories()
+    
+    def _full_targets(self, include_pseudo=False, include_remote=False):
+        """完整扫描目标：(挂载点或驱动器列表, 需跳过的挂载点列表)"""
+        return get_full_scan_roots(include_pseudo, include_remote)
+    
+    def _custom_targets(self, path):
+        """自定义扫描目标（文件或目录），不存在的路径由 scan() 记录在 target_errors 中"""
+        paths = [path] if isinstance(path, str) else list(path)
+        return [p for p in paths if p]
+    
+    @staticmethod
+    def _check_target(path):
+        """确认扫描路径存在且可以读取（目录可以列出，文件可以打开），否则抛出 OSError"""
+        st = os.stat(path)
+        if stat.S_ISDIR(st.st_mode):
+            with os.scandir(path):
+                pass
+        elif stat.S_ISREG(st.st_mode):
+            with open(path, 'rb'):
+                pass
+        else:
+            raise OSError(errno.EINVAL, 'not a regular file or directory', path)
+    
+    # ---- 流水线 ----
+    
+    def scan(self, paths, progress_callback=None, file_callback=None, batch_callback=None,
+             threat_callback=None, one_file_system=False, skip_paths=()):
+        """扫描目标路径列表
+
+        progress_callback / file_callback 逐个文件回调；
+        batch_callback 接收 ScanReporter 汇总的批量报告，发送频率受限，适合界面显示；
+        threat_callback 每发现一个威胁回调一次 {'path': 路径, 'threat': 威胁名称}。
+        one_file_system 为 True 时不跨越设备遍历；skip_paths 中的目录（如挂载点）整体跳过。
+        扫描被 control 取消时返回已发现的威胁，并将 cancelled 置为 True。
+        不存在或无法读取的扫描路径记录在 target_errors 中（{'path': 路径, 'error': errno 名称}）。
+        """
         self.scan_count = 0
         self.threats_found = 0
-        threats = []
-        
-        # 获取所有驱动器
-        drives = [f'{chr(c)}:' for c in range(65, 91) if os.path.exists(f'{chr(c)}:')]
-        total_files = self._count_files(drives)
-        scanned_files = 0
+        self.cache_hits = 0
+        self.scan_errors = 0
+        self.target_errors = []
+        self.cancelled = False
+        self.type_counts = {}
+        self.bytes_skipped = 0
         
-        for drive in drives:
-            for root, _, files in os.walk(drive):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if not self._is_trusted(file_path):
-                        self.scan_count += 1
-                        scanned_files += 1
-                        
-                        # 更新进度
-                        if progress_callback:
-                            progress = int((scanned_files / total_files) * 100)
-                            progress_callback.emit(min(progress, 100))
-                        
-                        # 回调文件信息
-                        if file_callback:
-                            file_callback.emit(file_path)
-                        
-                        # 扫描文件
-                        if self._scan_file(file_path):
-                            threats.append(file_path)
-                            self.threats_found += 1
-                        
-                        # 模拟扫描延迟
-                        time.sleep(0.001)
+        # 扫描根目录解析为真实路径，遍历得到的路径即可直接与信任路径比较
+        roots = []
+        for path in paths:
+            try:
+                self._check_target(path)
+            except OSError as e:
+                self.target_errors.append({'path': path, 'error': error_name(e.errno)})
+                continue
+            roots.append(os.path.realpath(path))
+        if not roots:
+            return []
+        prune = self._is_excluded
+        if skip_paths:
+            skip = frozenset(skip_paths)
+            
+            def prune(path):
+                return path in skip or self._is_excluded(path)
+        cache = self._open_cache()
+        if self.io_concurrency:
+            # 异步模式：枚举、过滤与检测在事件循环中并发进行
+            from core.async_scan import AsyncScanPipeline
+            walker = AsyncScanPipeline(self, roots, prune=prune, one_file_system=one_file_system, cache=cache,
+                                       concurrency=self.io_concurrency, mount_concurrency=self.mount_concurrency)
+            items = walker.items()
+        else:
+            walker = FileWalker(roots, prune=prune, one_file_system=one_file_system, metrics=self.metrics)
+            items = self._enumerate_stage(walker)
+            items = self._filter_stage(items, cache)
+            items = self._detect_stage(items, cache)
+        writer = None
+        if self.metrics:
+            self.metrics.reset(walker)
+            if self.metrics_path:
+                writer = PrometheusTextfileWriter(self.stats, self.metrics_path, self.metrics_interval)
+                writer.start()
         
-        return threats
+        try:
+            return self._report_stage(items, walker, progress_callback, file_callback,
+                                      batch_callback, threat_callback)
+        finally:
+            items.close()
+            if cache:
+                self.cache_hits = cache.hits
+                cache.close()
+            if self.metrics:
+                self.metrics.finish()
+            if writer:
+                writer.stop()
     
-    def custom_scan(self, path, progress_callback=None, file_callback=None):
-        """自定义扫描"""
-        self.scan_count = 0
-        self.threats_found = 0
+    def stats(self):
+        """扫描统计快照（可在扫描进行中从其他线程调用）
+
+        未启用 metrics 时只包含基本计数；启用时另有各阶段耗时直方图（stages）、
+        按 errno 分类的错误数（errors）与队列深度（queues），格式见 ScanMetrics.snapshot。
+        """
+        if self.metrics:
+            stats = self.metrics.snapshot()
+        else:
+            stats = {'counters': {'files': self.scan_count, 'cache_hits': self.cache_hits,
+                                  'threats': self.threats_found, 'scan_errors': self.scan_errors}}
+        stats['enabled'] = self.metrics is not None
+        stats['counters']['bytes_skipped'] = self.bytes_skipped
+        stats['file_types'] = dict(self.type_counts)
+        return stats
+    
+    def _enumerate_stage(self, walker):
+        """枚举阶段：单次遍历目录，产出 ScanItem"""
+        checkpoint = self._checkpoint
+        for entry in walker:
+            if checkpoint:
+                checkpoint()
+            yield ScanItem(entry.path, entry)
+    
+    def _filter_stage(self, items, cache):
+        """过滤阶段：排除被过滤器命中的文件，并标记缓存中未变化的安全文件"""
+        metrics = self.metrics
+        for item in items:
+            if metrics:
+                start = time.perf_counter()
+                excluded = self._is_excluded(item.path)
+                metrics.observe('filter', time.perf_counter() - start)
+                if excluded:
+                    metrics.skipped_trusted += 1
+                    continue
+            elif self._is_excluded(item.path):
+                continue
+            if cache:
+                item.key = VerdictCache.make_key(item.entry)
+                item.cached = cache.is_clean(item.key)
+            item.entry = None
+            yield item
+    
+    def _detect_stage(self, items, cache):
+        """读取/检测阶段：串行或按批次提交进程池，结果按输入顺序产出"""
+        if self.workers > 1:
+            results = self._detect_parallel(items)
+        else:
+            results = self._detect_serial(items)
+        try:
+            for item in results:
+                if cache and item.scanned and not item.threat and not item.incomplete:
+                    cache.store_clean(item.key)
+                yield item
+        finally:
+            results.close()
+    
+    def _report_stage(self, items, walker, progress_callback, file_callback, batch_callback, threat_callback):
+        """报告阶段：计数、进度与回调"""
         threats = []
+        last_progress = 0
+        reporter = ScanReporter(batch_callback) if batch_callback else None
+        metrics = self.metrics
+        try:
+            for item in items:
+                if self._checkpoint:
+                    self._checkpoint()
+                self.scan_count += 1
+                if metrics:
+                    metrics.record_item(item)
+                
+                # 更新进度（总数随遍历推进逐步增长，进度保持单调且完成前不超过 99）
+                progress = int((self.scan_count / walker.estimated_total()) * 100)
+                progress = min(max(progress, last_progress), 99)
+                if progress_callback and progress != last_progress:
+                    progress_callback.emit(progress)
+                last_progress = progress
+                
+                # 回调文件信息
+                if file_callback:
+                    file_callback.emit(item.path)
+                if item.error:
+                    self.scan_errors += 1
+                if item.scanned:
+                    self.type_counts[item.file_type] = self.type_counts.get(item.file_type, 0) + 1
+                    self.bytes_skipped += item.bytes_skipped
+                if reporter:
+                    reporter.file_scanned(item.threat_path if item.threat else item.path, progress, item.threat)
+                
+                if item.threat:
+                    threat_path = item.threat_path
+                    threats.append(threat_path)
+                    self.threats_found += 1
+                    if threat_callback:
+                        threat_callback.emit({'path': threat_path, 'threat': item.threat})
+        except ScanCancelled:
+            self.cancelled = True
         
-        if not os.path.exists(path):
-            return threats
-        
-        total_files = self._count_files([path])
-        scanned_files = 0
-        
-        for root, _, files in os.walk(path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if not self._is_trusted(file_path):
-                    self.scan_count += 1
-                    scanned_files += 1
-                    
-                    # 更新进度
-                    if progress_callback:
-                        progress = int((scanned_files / total_files) * 100)
-                        progress_callback.emit(min(progress, 100))
-                    
-                    # 回调文件信息
-                    if file_callback:
-                        file_callback.emit(file_path)
-                    
-                    # 扫描文件
-                    if self._scan_file(file_path):
-                        threats.append(file_path)
-                        self.threats_found += 1
-                    
-                    # 模拟扫描延迟
-                    time.sleep(0.005)
+        final_progress = last_progress if self.cancelled else 100
+        if progress_callback:
+            progress_callback.emit(final_progress)
+        if reporter:
+            reporter.flush(final_progress)
         
         return threats
     
-    def _count_files(self, paths):
-        """计算文件数量"""
-        count = 0
-        for path in paths:
-            if os.path.exists(path):
-                for _, _, files in os.walk(path):
-                    count += len(files)
-        return max(count, 1)  # 避免除零错误
+    def _detect_serial(self, items):
+        """在当前线程中逐个读取并检测文件"""
+        for item in items:
+            # 文件未变化且上次结果为安全，跳过内容扫描
+            if not item.cached:
+                item.update_from(self._throttled_check(item.path))
+            yield item
+    
+    def _detect_parallel(self, items):
+        """多进程并行读取与检测
+
+        当前线程遍历目录并按批次提交给进程池，未完成的批次数不超过 queue_depth，
+        结果按提交顺序取回，保证回调与计数顺序和串行模式一致。
+        缓存命中的文件不提交给工作进程。
+        """
+        # 使用 spawn 启动工作进程，避免在 GUI 多线程进程中 fork
+        context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                   initializer=_init_worker, initargs=(self,))
+        metrics = self.metrics
+        try:
+            pending = deque()
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+                pending.append(self._submit_batch(pool, batch))
+                batch = []
+                if metrics:
+                    metrics.set_queue_depth(len(pending))
+                while len(pending) >= self.queue_depth:
+                    yield from self._collect_batch(pending.popleft())
+            if batch:
+                pending.append(self._submit_batch(pool, batch))
+            while pending:
+                if metrics:
+                    metrics.set_queue_depth(len(pending))
+                yield from self._collect_batch(pending.popleft())
+            if metrics:
+                metrics.set_queue_depth(0)
+        finally:
+            # 取消或异常退出时丢弃尚未开始的批次，正在执行的批次会在取消点退出
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def _submit_batch(self, pool, batch):
+        """提交批次中需要扫描的文件；进程池已不可用时不提交，由 _collect_batch 在当前进程中检测"""
+        paths = [item.path for item in batch if not item.cached]
+        future = None
+        if paths:
+            try:
+                future = pool.submit(_scan_batch, paths)
+            except (BrokenProcessPool, RuntimeError):
+                pass
+        return batch, future
+    
+    def _collect_batch(self, pending_batch):
+        """等待一个批次完成并按顺序产出结果
+
+        工作进程异常退出（BrokenProcessPool）或结果无法传回时，该批次在当前进程中重新检测，
+        不会把未检测的文件当作安全文件报告。扫描已取消时，工作进程的中断或退出按取消处理。
+        """
+        batch, future = pending_batch
+        results = None
+        if future is not None:
+            try:
+                results = iter(future.result())
+            except ScanCancelled:
+                raise
+            except (KeyboardInterrupt, BrokenProcessPool) as e:
+                if self.control and self.control.cancelled:
+                    raise ScanCancelled() from e
+                if isinstance(e, KeyboardInterrupt):
+                    raise
+                results = None
+            except Exception:
+                results = None
+        for item in batch:
+            if not item.cached:
+                item.update_from(next(results) if results is not None else self._throttled_check(item.path))
+            yield item
@@ -0,0 +1,220 @@
+import errno
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# 计时的扫描阶段：list 列出目录，filter 过滤器判断，open 打开文件并获取大小，
+# read 读取文件头并判断类型，match 特征匹配、哈希与容器成员检测
+# （文件内容在匹配过程中按块读入，第一块之后的读盘计入 match）
+STAGES = ('list', 'filter', 'open', 'read', 'match')
+
+# 直方图桶上界（秒），最后一个桶为 +Inf
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus 指标名前缀
+PREFIX = 'jisu_scan'
+
+
+def error_name(code):
+    """errno 数值转换为名称（如 EACCES），没有 errno 的错误记为 other"""
+    return errno.errorcode.get(code, 'other') if code is not None else 'other'
+
+
+class Histogram:
+    """耗时直方图"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def snapshot(self):
+        """返回 {'count', 'sum', 'buckets': [(上界, 累计数量), ...]}，最后一个上界为 inf"""
+        buckets = []
+        total = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), list(self.counts)):
+            total += count
+            buckets.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class ScanMetrics:
+    """扫描指标：各阶段耗时直方图、计数器与队列深度
+
+    只由扫描线程写入，stats() 快照可在其他线程读取。
+    并行模式下工作进程把各文件的阶段耗时记录在 ScanItem 中，由主进程汇总。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, walker=None):
+        """开始新的扫描"""
+        self.walker = walker
+        self.started = time.monotonic()
+        self.finished = None
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.files = 0
+        self.bytes = 0
+        self.skipped_trusted = 0
+        self.cache_hits = 0
+        self.threats = 0
+        self.errors = {}
+        self.queue_depth = 0
+        self.queue_depth_max = 0
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def error(self, code):
+        name = error_name(code)
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def set_queue_depth(self, depth):
+        """并行模式下已提交、尚未取回的批次数"""
+        self.queue_depth = depth
+        if depth > self.queue_depth_max:
+            self.queue_depth_max = depth
+
+    def record_item(self, item):
+        """汇总一个完成检测的文件"""
+        self.files += 1
+        if item.cached:
+            self.cache_hits += 1
+        if item.scanned:
+            self.bytes += item.size
+        if item.error:
+            self.errors[item.error] = self.errors.get(item.error, 0) + 1
+        if item.threat:
+            self.threats += 1
+        if item.timings:
+            stages = self.stages
+            opened, read, matched = item.timings
+            stages['open'].observe(opened)
+            stages['read'].observe(read)
+            stages['match'].observe(matched)
+
+    def snapshot(self):
+        walker = self.walker
+        end = self.finished if self.finished is not None else time.monotonic()
+        return {
+            'running': self.finished is None,
+            'elapsed': round(end - self.started, 3),
+            'counters': {
+                'files': self.files,
+                'bytes': self.bytes,
+                'skipped_trusted': self.skipped_trusted,
+                'cache_hits': self.cache_hits,
+                'threats': self.threats,
+                'dirs_listed': walker.dirs_listed if walker else 0,
+                'dirs_skipped': walker.dirs_skipped if walker else 0,
+                'dirs_pruned': walker.dirs_pruned if walker else 0,
+            },
+            'errors': dict(self.errors),
+            'queues': {
+                'batches': self.queue_depth,
+                'batches_max': self.queue_depth_max,
+                'dirs': walker.pending_dirs if walker else 0,
+            },
+            'stages': {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+        }
+
+    def __getstate__(self):
+        # 随扫描引擎传入工作进程时不携带遍历器
+        state = self.__dict__.copy()
+        state['walker'] = None
+        return state
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_prometheus(stats):
+    """把 ScanEngine.stats() 快照转换为 Prometheus 文本格式"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+            label_text = '{' + label_text + '}' if label_text else ''
+            lines.append(f'{PREFIX}_{name}{suffix}{label_text} {_format_value(value)}')
+
+    metric('running', 'gauge', 'Whether a scan is in progress.', [('', (), int(stats['running']))])
+    metric('elapsed_seconds', 'gauge', 'Duration of the current or last scan.', [('', (), stats['elapsed'])])
+    for name, value in stats['counters'].items():
+        metric(f'{name}_total', 'counter', f'Scan counter {name}.', [('', (), value)])
+    metric('errors_total', 'counter', 'Files or directories that could not be read, by errno.',
+           [('', (('errno', name),), count) for name, count in sorted(stats['errors'].items())])
+    metric('file_types_total', 'counter', 'Scanned files by detected type.',
+           [('', (('type', name),), count) for name, count in sorted(stats['file_types'].items())])
+    metric('queue_depth', 'gauge', 'Pending work items by queue.',
+           [('', (('queue', name),), value) for name, value in stats['queues'].items()])
+
+    samples = []
+    for stage, histogram in stats['stages'].items():
+        for bound, count in histogram['buckets']:
+            samples.append(('_bucket', (('stage', stage), ('le', _format_value(bound))), count))
+        samples.append(('_sum', (('stage', stage),), histogram['sum']))
+        samples.append(('_count', (('stage', stage),), histogram['count']))
+    metric('stage_seconds', 'histogram', 'Time spent per file or directory in each scan stage.', samples)
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusTextfileWriter:
+    """定期把扫描指标写入 Prometheus 文本文件（供 node_exporter 的 textfile collector 读取）
+
+    先写入同目录下的临时文件再原子替换，采集方不会读到写了一半的文件。
+    """
+
+    def __init__(self, stats_source, path, interval=15.0):
+        self.stats_source = stats_source
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止定期写入，并写入最终结果"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(format_prometheus(self.stats_source()))
+            os.replace(temp_path, self.path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
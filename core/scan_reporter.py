@@ -0,0 +1,52 @@
+import time
+from collections import deque
+
+
+class ScanReporter:
+    """批量扫描报告
+
+    汇总逐个文件的扫描结果，每秒最多向界面发送 max_rate 次报告，
+    每次报告包含累计计数、进度以及最近扫描的若干文件路径。
+    """
+
+    def __init__(self, callback, max_rate=10, sample_size=20):
+        self.callback = callback
+        self.interval = 1.0 / max_rate if max_rate else 0
+        self.recent = deque(maxlen=sample_size)
+        self.scanned = 0
+        self.threats = 0
+        self.progress = 0
+        self._new = 0
+        self._new_threats = []
+        self._next_emit = 0.0
+
+    def file_scanned(self, file_path, progress, threat=None):
+        """记录一个文件的扫描结果，到达发送间隔时发送报告"""
+        self.scanned += 1
+        self._new += 1
+        self.progress = progress
+        self.recent.append(file_path)
+        if threat:
+            self.threats += 1
+            self._new_threats.append(file_path)
+        now = time.monotonic()
+        if now >= self._next_emit:
+            self._next_emit = now + self.interval
+            self.flush()
+
+    def flush(self, progress=None):
+        """立即发送当前汇总（扫描结束时调用）"""
+        if progress is not None:
+            self.progress = progress
+        report = {
+            'scanned': self.scanned,
+            'new': self._new,
+            'threats': self.threats,
+            'new_threats': self._new_threats,
+            'progress': self.progress,
+            'recent': list(self.recent),
+        }
+        self._new = 0
+        self._new_threats = []
+        self.recent.clear()
+        self.callback.emit(report)
@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶（可由多个线程同时使用，如异步模式的检测线程）"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def consume(self, amount, factor=1.0):
+        """取出令牌，返回需要等待的秒数（令牌允许透支，由等待补足）"""
+        rate = self.rate * factor
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * rate)
+            self.last = now
+            self.tokens -= amount
+            tokens = self.tokens
+        if tokens >= 0:
+            return 0.0
+        return -tokens / rate
+
+
+class ScanThrottle:
+    """扫描限速器
+
+    bytes_per_sec / files_per_sec: 读取字节数与文件数的速率上限，None 表示不限制
+    duty_cycle: 扫描占用时间的比例上限（0-1），用于限制 CPU 占用
+    load_threshold: 每核平均负载阈值（os.getloadavg），超过时降低速率
+    disk_busy_threshold: 磁盘繁忙比例阈值（/proc/diskstats），超过时降低速率
+
+    系统繁忙时速率系数逐步减半（最低 min_factor），空闲后逐步恢复。
+    同一限速器可由多个线程共用（异步模式），速率上限为所有线程合计。
+    判断繁忙时扣除扫描自身的负载：平均负载减去扫描进程占用的核数（运行或等待 I/O，即未在限速等待的时间，
+    多线程时不少于实际 CPU 时间），磁盘繁忙比例按扫描进程的读写量
+    占全部磁盘读写量的比例扣除（并行模式下按 partition 的进程数估算全部工作进程），
+    只有其他程序繁忙时才降低速率，扫描不会因自身的负载把自己限速。
+    未设置任何限制时为不限速模式，throttle 调用几乎没有开销。
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, bytes_per_sec=None, files_per_sec=None, duty_cycle=1.0,
+                 load_threshold=None, disk_busy_threshold=None, min_factor=0.1):
+        self.bytes_per_sec = bytes_per_sec
+        self.files_per_sec = files_per_sec
+        self.duty_cycle = duty_cycle
+        self.load_threshold = load_threshold
+        self.disk_busy_threshold = disk_busy_threshold
+        self.min_factor = min_factor
+        # 共同扫描的进程数（partition 设置），用于估算全部工作进程的负载
+        self.parts = 1
+        self.factor = 1.0
+        self.adaptive = load_threshold is not None or disk_busy_threshold is not None
+        self.enabled = bool(bytes_per_sec or files_per_sec or duty_cycle < 1.0 or self.adaptive)
+        self._lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def unthrottled(cls):
+        """不限速"""
+        return cls()
+
+    @classmethod
+    def background(cls):
+        """后台模式：不设固定上限，系统负载或磁盘繁忙时自动让出资源"""
+        return cls(load_threshold=1.0, disk_busy_threshold=0.8)
+
+    def _reset(self):
+        self._bytes_bucket = TokenBucket(self.bytes_per_sec) if self.bytes_per_sec else None
+        self._files_bucket = TokenBucket(self.files_per_sec) if self.files_per_sec else None
+        self._next_check = 0.0
+        self._disk_ticks = None
+        self._cpu_time = None
+        # 累计的限速等待时间
+        self._slept = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_disk_ticks'] = None
+        state['_cpu_time'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def partition(self, parts):
+        """按工作进程数均分速率上限，各进程独立限速"""
+        parts = max(int(parts), 1)
+        throttle = ScanThrottle(
+            self.bytes_per_sec / parts if self.bytes_per_sec else None,
+            self.files_per_sec / parts if self.files_per_sec else None,
+            self.duty_cycle, self.load_threshold, self.disk_busy_threshold, self.min_factor
+        )
+        throttle.parts = parts
+        return throttle
+
+    def throttle(self, nbytes, busy_seconds=0.0):
+        """扫描完一个文件后调用，按需等待"""
+        if not self.enabled:
+            return
+        if self.adaptive:
+            self._update_factor()
+        factor = self.factor
+        wait = 0.0
+        if self._files_bucket:
+            wait = self._files_bucket.consume(1, factor)
+        if self._bytes_bucket and nbytes:
+            wait = max(wait, self._bytes_bucket.consume(nbytes, factor))
+        duty = self.duty_cycle * factor
+        if duty < 1.0 and busy_seconds > 0:
+            wait = max(wait, busy_seconds * (1.0 / duty - 1.0))
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                self._slept += wait
+
+    def _update_factor(self):
+        """根据系统负载与磁盘繁忙程度调整速率系数（同一时间只有一个线程检查）"""
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if now >= self._next_check:
+                self._next_check = now + self.CHECK_INTERVAL
+                self._check_busy(now)
+        finally:
+            self._lock.release()
+
+    def _check_busy(self, now):
+        busy = False
+        if self.load_threshold is not None:
+            load = self._load_per_cpu(self._own_cores(now))
+            busy = load is not None and load > self.load_threshold
+        if self.disk_busy_threshold is not None and not busy:
+            disk = self._disk_busy(now)
+            busy = disk is not None and disk > self.disk_busy_threshold
+        if busy:
+            self.factor = max(self.factor / 2, self.min_factor)
+        else:
+            self.factor = min(self.factor * 1.25, 1.0)
+
+    def _own_cores(self, now):
+        """自上次检查以来扫描进程平均占用的核数（乘以进程数），第一次检查时返回 0"""
+        cpu_time = time.process_time()
+        previous = self._cpu_time
+        self._cpu_time = (now, cpu_time, self._slept)
+        if previous is None or now <= previous[0]:
+            return 0.0
+        elapsed = now - previous[0]
+        active = max(1.0 - (self._slept - previous[2]) / elapsed, 0.0)
+        return max((cpu_time - previous[1]) / elapsed, active) * self.parts
+
+    @staticmethod
+    def _load_per_cpu(own_cores=0.0):
+        """扣除扫描自身使用的核数后的每核 1 分钟平均负载，不支持的平台返回 None"""
+        try:
+            return max(os.getloadavg()[0] - own_cores, 0.0) / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return None
+
+    @staticmethod
+    def _own_io_bytes():
+        """扫描进程实际读写磁盘的累计字节数（/proc/self/io），不支持的平台返回 None"""
+        try:
+            with open('/proc/self/io', 'r') as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+            return int(fields['read_bytes']) + int(fields['write_bytes'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_busy(self, now):
+        """自上次检查以来最繁忙磁盘的繁忙比例（扣除扫描自身读写所占的部分），不支持的平台返回 None"""
+        ticks = {}
+        sectors = 0
+        try:
+            with open('/proc/diskstats', 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) < 13 or parts[2].startswith(('loop', 'ram')):
+                        continue
+                    # 第 13 列为设备处理 I/O 的累计毫秒数，第 6、10 列为读、写扇区数（512 字节）
+                    ticks[parts[2]] = int(parts[12])
+                    sectors += int(parts[5]) + int(parts[9])
+        except (OSError, ValueError):
+            return None
+        own_bytes = self._own_io_bytes()
+        previous = self._disk_ticks
+        self._disk_ticks = (now, ticks, sectors, own_bytes)
+        if previous is None:
+            return None
+        elapsed_ms = (now - previous[0]) * 1000
+        if elapsed_ms <= 0:
+            return None
+        busiest = 0
+        for name, value in ticks.items():
+            busiest = max(busiest, value - previous[1].get(name, value))
+        # 分区与整盘的扇区数会重复计入，得到的扫描占比偏低，扣除偏保守
+        total_bytes = (sectors - previous[2]) * 512
+        if own_bytes is not None and previous[3] is not None and total_bytes > 0:
+            own_share = min((own_bytes - previous[3]) * self.parts / total_bytes, 1.0)
+        else:
+            own_share = 0.0
+        return busiest / elapsed_ms * (1.0 - own_share)
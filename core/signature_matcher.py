@@ -0,0 +1,455 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import deque
+
+from core.file_type import FILE_TYPES
+
+# 编译后的特征库文件格式:
+#   文件头 | 元数据(JSON) | 威胁名称偏移表 | 威胁名称 | 各匹配器的 base/check/fail/match 表
+# 所有整数均为小端序；匹配器表按 8 字节对齐，加载时直接以 memoryview 映射，无需反序列化
+_MAGIC = b'JSSG'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sI16sIIQQQQ')
+
+
+class SignatureMatcher:
+    """多模式特征匹配器
+
+    基于 Aho-Corasick 自动机，一次遍历即可同时匹配所有字节特征，
+    扫描开销只与文件字节数有关，与特征数量无关。
+    自动机以双数组（base/check）形式存放，状态转移只需数组下标运算。
+    特征可限定适用的文件类型（见 core.file_type），for_type 返回只包含适用特征的匹配器。
+    """
+
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, signatures):
+        """signatures 为 (威胁名称, 特征字节) 或 (威胁名称, 特征字节, 文件类型列表) 列表"""
+        self.names = []
+        self.patterns = []
+        # 每个特征适用的文件类型，None 表示适用于所有类型
+        self.types = []
+        digest = hashlib.sha256()
+        for signature in signatures:
+            name, pattern = signature[0], signature[1]
+            types = frozenset(signature[2]) if len(signature) > 2 and signature[2] else None
+            if pattern:
+                self.names.append(name)
+                self.patterns.append(bytes(pattern))
+                self.types.append(types)
+                digest.update(name.encode('utf-8') + b'\0' + self.patterns[-1] + b'\0')
+                if types:
+                    digest.update(','.join(sorted(types)).encode('ascii') + b'\0')
+        # 特征库版本，由特征内容决定
+        self.version = digest.hexdigest()[:16]
+        self.base, self.check, self.fail, self.match = self._build(self.patterns)
+        self._any_typed = any(types is not None for types in self.types)
+        self._typed = {}
+        self.db_path = None
+
+    @classmethod
+    def _from_tables(cls, names, version, tables):
+        """由已构建的自动机表创建匹配器，表中的特征编号对应 names 中的全局编号"""
+        matcher = cls.__new__(cls)
+        matcher.names = names
+        matcher.patterns = None
+        matcher.types = None
+        matcher.version = version
+        matcher.base, matcher.check, matcher.fail, matcher.match = tables
+        matcher._any_typed = False
+        matcher._typed = {}
+        matcher.db_path = None
+        return matcher
+
+    @classmethod
+    def from_file(cls, file_path):
+        """从特征源文件加载
+
+        文本格式每行 名称:十六进制特征[:文件类型,...]，# 开头为注释；
+        .json 文件为 [{"name": 名称, "pattern": 十六进制特征, "types": [文件类型, ...]}, ...]
+        """
+        if file_path.lower().endswith('.json'):
+            return cls(cls._read_json(file_path))
+        signatures = []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                signature = cls._parse_line(line)
+                if signature:
+                    signatures.append(signature)
+        return cls(signatures)
+
+    @staticmethod
+    def _read_json(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        if isinstance(records, dict):
+            records = records.get('signatures', [])
+        signatures = []
+        for record in records:
+            try:
+                types = [t for t in record.get('types') or () if t in FILE_TYPES]
+                signatures.append((record['name'], bytes.fromhex(record['pattern']), types))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        return signatures
+
+    @staticmethod
+    def _parse_line(line):
+        """解析 名称:十六进制特征[:文件类型,文件类型...]，格式错误返回 None"""
+        parts = line.rsplit(':', 2)
+        if len(parts) == 3:
+            types = [t.strip() for t in parts[2].split(',')]
+            if all(t in FILE_TYPES for t in types):
+                try:
+                    return parts[0], bytes.fromhex(parts[1]), types
+                except ValueError:
+                    pass
+        name, _, hex_pattern = line.rpartition(':')
+        try:
+            return name, bytes.fromhex(hex_pattern)
+        except ValueError:
+            return None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):
+        if self.db_path:
+            # 编译特征库在工作进程中按路径重新映射，共享同一份页缓存
+            return {'db_path': self.db_path}
+        state = self.__dict__.copy()
+        state['_typed'] = {}
+        return state
+
+    def __setstate__(self, state):
+        if set(state) == {'db_path'}:
+            self.__dict__.update(SignatureMatcher.load(state['db_path']).__dict__)
+        else:
+            self.__dict__.update(state)
+
+    def for_type(self, file_type):
+        """返回适用于该文件类型的匹配器，没有适用的特征时返回 None
+
+        类型未知（unknown）的文件使用全部特征。按类型筛选出的匹配器在首次使用时构建并缓存。
+        """
+        if not self.names:
+            return None
+        if file_type == 'unknown' or not self._any_typed:
+            return self
+        if file_type not in self._typed:
+            applicable = [i for i, types in enumerate(self.types) if types is None or file_type in types]
+            if len(applicable) == len(self.names):
+                matcher = self
+            elif not applicable:
+                matcher = None
+            else:
+                matcher = self._subset(applicable)
+            self._typed[file_type] = matcher
+        return self._typed[file_type]
+
+    def _subset(self, indices):
+        """只包含指定特征的匹配器，命中时报告的仍是全局特征编号"""
+        base, check, fail, match = self._build([self.patterns[i] for i in indices])
+        match = array('i', [indices[m] if m >= 0 else -1 for m in match])
+        return SignatureMatcher._from_tables(self.names, self.version, (base, check, fail, match))
+
+    def _build(self, patterns):
+        """构建自动机并压缩为双数组"""
+        # 1. 构建字典树
+        children = [{}]
+        terminal = [-1]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for byte in pattern:
+                nxt = children[node].get(byte)
+                if nxt is None:
+                    nxt = len(children)
+                    children[node][byte] = nxt
+                    children.append({})
+                    terminal.append(-1)
+                node = nxt
+            if terminal[node] < 0:
+                terminal[node] = index
+
+        # 2. 按广度优先顺序把节点放入双数组
+        node_count = len(children)
+        position = [0] * node_count
+        base = [0]
+        check = [-1]
+        used = bytearray(1)
+        used[0] = 1
+        free = 1
+        # 多分支节点单独维护起点，避免在单分支节点留下的空洞中反复试探
+        wide_free = 1
+        order = []
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            edges = children[node]
+            if not edges:
+                continue
+            keys = sorted(edges)
+            first = keys[0]
+            wide = len(keys) > 1
+            slot = max(free, wide_free) if wide else free
+            while True:
+                node_base = slot - first
+                if node_base >= 1:
+                    end = node_base + keys[-1] + 1
+                    if end > len(used):
+                        used.extend(bytes(end - len(used)))
+                    if all(not used[node_base + key] for key in keys):
+                        break
+                nxt = used.find(0, slot + 1)
+                slot = nxt if nxt >= 0 else max(slot + 1, len(used))
+            if wide:
+                wide_free = slot
+            p = position[node]
+            base[p] = node_base
+            for key in keys:
+                index = node_base + key
+                used[index] = 1
+                if index >= len(base):
+                    grow = index + 1 - len(base)
+                    base.extend([0] * grow)
+                    check.extend([-1] * grow)
+                check[index] = p
+                position[edges[key]] = index
+                queue.append(edges[key])
+            free = used.find(0, free)
+            if free < 0:
+                free = len(used)
+
+        # 3. 计算失败链接及每个状态可报告的匹配
+        size = max(base) + 256 + 1
+        if len(base) < size:
+            base.extend([0] * (size - len(base)))
+            check.extend([-1] * (size - len(check)))
+        fail = [0] * size
+        match = [-1] * size
+        trie_fail = [0] * node_count
+        for node in order:
+            p = position[node]
+            for byte, child in children[node].items():
+                if node == 0:
+                    trie_fail[child] = 0
+                else:
+                    f = trie_fail[node]
+                    while f and byte not in children[f]:
+                        f = trie_fail[f]
+                    trie_fail[child] = children[f].get(byte, 0)
+            own = terminal[node]
+            match[p] = own if own >= 0 else match[position[trie_fail[node]]]
+            fail[p] = position[trie_fail[node]]
+        match[0] = terminal[0]
+
+        return array('i', base), array('i', check), array('i', fail), array('i', match)
+
+    def save(self, output_path):
+        """编译为特征库文件，各文件类型适用的匹配器预先构建并一同写入
+
+        返回写入的匹配器数量。
+        """
+        matchers = [self]
+        typed = {}
+        for file_type in FILE_TYPES:
+            if file_type == 'unknown':
+                continue
+            matcher = self.for_type(file_type)
+            if matcher is None:
+                typed[file_type] = None
+                continue
+            if matcher not in matchers:
+                matchers.append(matcher)
+            typed[file_type] = matchers.index(matcher)
+
+        encoded = [name.encode('utf-8') for name in self.names]
+        name_offsets = [0]
+        for name in encoded:
+            name_offsets.append(name_offsets[-1] + len(name))
+
+        names_offset = _HEADER.size
+        offset = names_offset + 4 * len(name_offsets) + name_offsets[-1]
+        tables = []
+        for matcher in matchers:
+            offset = (offset + 7) // 8 * 8
+            tables.append({'offset': offset, 'size': len(matcher.base)})
+            offset += 16 * len(matcher.base)
+        metadata = json.dumps({'any_typed': self._any_typed, 'types': typed, 'matchers': tables}).encode('utf-8')
+
+        temp_path = output_path + '.tmp'
+        with open(temp_path, 'wb') as out:
+            out.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, self.version.encode('ascii'), len(self.names),
+                                   len(matchers), names_offset, offset, len(metadata), offset + len(metadata)))
+            out.write(struct.pack(f'<{len(name_offsets)}I', *name_offsets))
+            out.write(b''.join(encoded))
+            for matcher, table in zip(matchers, tables):
+                out.write(bytes(table['offset'] - out.tell()))
+                for values in (matcher.base, matcher.check, matcher.fail, matcher.match):
+                    out.write(array('i', values).tobytes())
+            out.write(metadata)
+        os.replace(temp_path, output_path)
+        return len(matchers)
+
+    @staticmethod
+    def db_version(file_path):
+        """读取编译后特征库的版本，文件无效时抛出 ValueError"""
+        with open(file_path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"无效的特征库文件: {file_path}")
+        magic, version, signature_version = _HEADER.unpack(header)[:3]
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"无效的特征库文件: {file_path}")
+        return signature_version.decode('ascii')
+
+    @classmethod
+    def load(cls, file_path):
+        """以只读 mmap 方式加载编译后的特征库
+
+        自动机表与威胁名称直接映射文件内容，不复制为 Python 对象，加载时间与特征数量无关；
+        多个工作进程加载同一文件时共享页缓存。
+        """
+        with open(file_path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, signature_version, count, matcher_count, names_offset, metadata_offset,
+             metadata_size, file_size) = _HEADER.unpack_from(mm, 0)
+            if magic != _MAGIC or version != _FORMAT_VERSION or len(mm) < file_size:
+                raise ValueError('文件头无效')
+            metadata = json.loads(mm[metadata_offset:metadata_offset + metadata_size])
+            names = _NameTable(mm, names_offset, count)
+            signature_version = signature_version.decode('ascii')
+            matchers = [cls._from_tables(names, signature_version, cls._map_tables(mm, table))
+                        for table in metadata['matchers']]
+            matcher = matchers[0]
+            matcher._any_typed = metadata['any_typed']
+            for file_type, index in metadata['types'].items():
+                matcher._typed[file_type] = None if index is None else matchers[index]
+        except (struct.error, KeyError, IndexError, TypeError, ValueError) as e:
+            mm.close()
+            raise ValueError(f"无效的特征库文件: {file_path}") from e
+        matcher.db_path = file_path
+        return matcher
+
+    @staticmethod
+    def _map_tables(mm, table):
+        offset = table['offset']
+        size = table['size']
+        view = memoryview(mm)
+        return tuple(view[offset + i * 4 * size:offset + (i + 1) * 4 * size].cast('i') for i in range(4))
+
+    def feed(self, data, state=0):
+        """匹配一段数据
+
+        返回 (新状态, 特征编号)，未命中时特征编号为 -1。
+        状态可传入下一段数据，从而匹配跨越分块边界的特征。
+        """
+        base = self.base
+        check = self.check
+        fail = self.fail
+        match = self.match
+        for byte in data:
+            while True:
+                nxt = base[state] + byte
+                if check[nxt] == state:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if match[state] >= 0:
+                return state, match[state]
+        return state, -1
+
+    def scan_stream(self, stream, chunk_size=None, checkpoint=None):
+        """分块读取流并匹配，返回命中的威胁名称，未命中返回 None
+
+        checkpoint 为可选的取消点函数，在每个分块之前调用。
+        """
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        state = 0
+        while True:
+            if checkpoint:
+                checkpoint()
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return None
+            state, found = self.feed(chunk, state)
+            if found >= 0:
+                return self.names[found]
+
+    def scan_buffer(self, data, chunk_size=None, checkpoint=None):
+        """分块匹配内存中的数据（bytes / memoryview / mmap），返回命中的威胁名称"""
+        if not self.names:
+            return None
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        view = memoryview(data)
+        try:
+            state = 0
+            for offset in range(0, len(view), chunk_size):
+                if checkpoint:
+                    checkpoint()
+                state, found = self.feed(view[offset:offset + chunk_size], state)
+                if found >= 0:
+                    return self.names[found]
+            return None
+        finally:
+            view.release()
+
+    def scan_file(self, file_path, chunk_size=None, checkpoint=None):
+        """扫描文件内容，返回命中的威胁名称，未命中返回 None"""
+        if not self.names:
+            return None
+        with open(file_path, 'rb') as f:
+            return self.scan_stream(f, chunk_size, checkpoint)
+
+
+class _NameTable:
+    """映射在特征库文件中的威胁名称表，只在命中时解码对应的名称"""
+
+    def __init__(self, mm, offset, count):
+        self._mm = mm
+        self._offsets = memoryview(mm)[offset:offset + 4 * (count + 1)].cast('I')
+        self._base = offset + 4 * (count + 1)
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._base + self._offsets[index]
+        end = self._base + self._offsets[index + 1]
+        return self._mm[start:end].decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+
+def main(argv=None):
+    """命令行: python -m core.signature_matcher 特征源(.txt/.json) 输出.db"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print(main.__doc__)
+        return 2
+    matcher = SignatureMatcher.from_file(argv[0])
+    tables = matcher.save(argv[1])
+    print(f"已编译 {len(matcher)} 条特征（{tables} 组匹配表）到 {argv[1]}，版本 {matcher.version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
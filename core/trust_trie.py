@@ -0,0 +1,58 @@
+import os
+
+# 标记信任路径终点的键（路径分量均为字符串，不会冲突）
+_END = None
+
+
+class TrustTrie:
+    """信任路径前缀树
+
+    按路径分量存储信任路径，查询耗时只与路径深度有关，
+    且按完整分量匹配：信任 /data/app 不会误信任 /data/app2。
+    """
+
+    def __init__(self, paths=()):
+        self.root = {}
+        self.size = 0
+        for path in paths:
+            self.add(path)
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _split(path, resolve=False):
+        """拆分路径分量，resolve 为 True 时先解析符号链接"""
+        if resolve:
+            path = os.path.realpath(path)
+        path = os.path.normcase(os.path.normpath(path))
+        drive, rest = os.path.splitdrive(path)
+        parts = [part for part in rest.split(os.sep) if part]
+        return [drive] + parts
+
+    def add(self, path):
+        """添加信任路径（解析为真实路径后存储）"""
+        if not path:
+            return
+        node = self.root
+        for part in self._split(path, resolve=True):
+            node = node.setdefault(part, {})
+        if _END not in node:
+            node[_END] = True
+            self.size += 1
+
+    def is_trusted(self, path, resolve=False):
+        """检查路径是否位于某个信任路径之下（含自身）
+
+        遍历得到的路径已基于真实路径拼接，默认不再调用 realpath，避免额外的系统调用。
+        """
+        if not self.size:
+            return False
+        node = self.root
+        for part in self._split(path, resolve):
+            node = node.get(part)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
@@ -1,54 +1,510 @@
-import time
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import struct
+import sys
+from collections import deque
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlparse
+from urllib.request import Request, url2pathname, urlopen
+
+from core.hash_blocklist import hash_file
+from core.signature_matcher import SignatureMatcher
+
+# 差量补丁格式（rsync 式 复制/插入 指令流，指令部分以 xz 压缩）:
+#   文件头 | 压缩的指令流
+#   C <偏移 Q><长度 I>        从旧文件复制
+#   D <偏移 Q><长度 I><数据>  与旧文件对应位置的数据异或（变化零散的区域，异或结果大多为 0，压缩率高）
+#   I <长度 I><数据>          插入新数据
+#   E                         结束
+_DELTA_MAGIC = b'JSDL'
+_DELTA_VERSION = 1
+_DELTA_HEADER = struct.Struct('<4sIQQ32s32s')
+_COPY = struct.Struct('<QI')
+_INSERT = struct.Struct('<I')
+
+DELTA_BLOCK_SIZE = 64
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30
+MANIFEST_NAME = 'manifest.json'
+
+# 弱校验和（rsync 滚动校验和）取模
+_MOD = 1 << 16
+
+
+def parse_version(version):
+    """把 "1.10.0" 解析为 (1, 10, 0)，用于按数值比较版本号"""
+    parts = []
+    for part in str(version).strip().split('.'):
+        digits = ''.join(c for c in part if c.isdigit())
+        parts.append(int(digits) if digits else 0)
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def file_sha256(file_path):
+    return hash_file(file_path, ('sha256',))['sha256'].hex()
+
+
+def _weak_checksum(block):
+    a = sum(block) % _MOD
+    b = sum((len(block) - i) * byte for i, byte in enumerate(block)) % _MOD
+    return a, b
+
+
+def _xor(data, other):
+    size = len(data)
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(other, 'little')).to_bytes(size, 'little')
+
+
+def make_delta(old_path, new_path, delta_path, block_size=DELTA_BLOCK_SIZE):
+    """生成从旧文件到新文件的差量补丁，返回补丁大小
+
+    旧文件按固定大小分块建立索引，在新文件上滚动计算弱校验和查找相同的块（弱校验和命中后再比较内容）。
+    未找到相同块的区域按最近一次匹配的对齐位置与旧文件异或，无法对齐时直接插入。
+    """
+    with open(old_path, 'rb') as f:
+        old = f.read()
+    with open(new_path, 'rb') as f:
+        new = f.read()
+
+    index = {}
+    for offset in range(0, len(old) - block_size + 1, block_size):
+        a, b = _weak_checksum(old[offset:offset + block_size])
+        index.setdefault(a | (b << 16), []).append(offset)
+
+    ops = []
+    # 新文件位置到旧文件位置的偏移，初始假设两者对齐
+    shift = 0
+
+    def emit_literal(start, stop):
+        old_start = start + shift
+        if 0 <= old_start and old_start + (stop - start) <= len(old):
+            ops.append(('D', old_start, start, stop))
+        else:
+            ops.append(('I', start, stop))
+
+    literal_start = 0
+    position = 0
+    a = b = None
+    end = len(new) - block_size
+    while position <= end:
+        if a is None:
+            a, b = _weak_checksum(new[position:position + block_size])
+        match = None
+        candidates = index.get(a | (b << 16))
+        if candidates:
+            window = new[position:position + block_size]
+            # 优先选择与当前对齐位置一致的块
+            for offset in sorted(candidates, key=lambda o: o != position + shift):
+                if old[offset:offset + block_size] == window:
+                    match = offset
+                    break
+        if match is not None:
+            if literal_start < position:
+                emit_literal(literal_start, position)
+            if ops and ops[-1][0] == 'C' and ops[-1][1] + ops[-1][2] == match:
+                ops[-1] = ('C', ops[-1][1], ops[-1][2] + block_size)
+            else:
+                ops.append(('C', match, block_size))
+            shift = match - position
+            position += block_size
+            literal_start = position
+            a = None
+            continue
+        # 滚动一个字节
+        if position < end:
+            out_byte = new[position]
+            in_byte = new[position + block_size]
+            a = (a - out_byte + in_byte) % _MOD
+            b = (b - block_size * out_byte + a) % _MOD
+        position += 1
+    if literal_start < len(new):
+        emit_literal(literal_start, len(new))
+
+    temp_path = delta_path + '.tmp'
+    with open(temp_path, 'wb') as out:
+        out.write(_DELTA_HEADER.pack(_DELTA_MAGIC, _DELTA_VERSION, len(old), len(new),
+                                     hashlib.sha256(old).digest(), hashlib.sha256(new).digest()))
+        with lzma.LZMAFile(out, 'wb', preset=9) as stream:
+            for op in ops:
+                if op[0] == 'C':
+                    stream.write(b'C' + _COPY.pack(op[1], op[2]))
+                elif op[0] == 'D':
+                    _, old_start, start, stop = op
+                    stream.write(b'D' + _COPY.pack(old_start, stop - start))
+                    stream.write(_xor(new[start:stop], old[old_start:old_start + stop - start]))
+                else:
+                    stream.write(b'I' + _INSERT.pack(op[2] - op[1]))
+                    stream.write(new[op[1]:op[2]])
+            stream.write(b'E')
+    os.replace(temp_path, delta_path)
+    return os.path.getsize(delta_path)
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("差量补丁损坏")
+    return data
+
+
+def apply_delta(source_path, delta_path, output_path):
+    """把差量补丁应用到旧文件，生成新文件；旧文件或结果的 SHA-256 不符时抛出 ValueError"""
+    with open(delta_path, 'rb') as delta, open(source_path, 'rb') as source:
+        header = delta.read(_DELTA_HEADER.size)
+        if len(header) < _DELTA_HEADER.size:
+            raise ValueError("差量补丁不完整")
+        magic, version, source_size, target_size, source_digest, target_digest = _DELTA_HEADER.unpack(header)
+        if magic != _DELTA_MAGIC or version != _DELTA_VERSION:
+            raise ValueError("无效的差量补丁")
+        if os.fstat(source.fileno()).st_size != source_size or \
+                hash_file(source_path, ('sha256',))['sha256'] != source_digest:
+            raise ValueError("本地特征库与补丁的基础版本不一致")
+
+        digest = hashlib.sha256()
+        written = 0
+        with lzma.LZMAFile(delta, 'rb') as stream, open(output_path, 'wb') as out:
+            while True:
+                op = _read_exact(stream, 1)
+                if op == b'E':
+                    break
+                if op in (b'C', b'D'):
+                    offset, length = _COPY.unpack(_read_exact(stream, _COPY.size))
+                    if offset + length > source_size:
+                        raise ValueError("差量补丁损坏")
+                    source.seek(offset)
+                elif op == b'I':
+                    (length,) = _INSERT.unpack(_read_exact(stream, _INSERT.size))
+                else:
+                    raise ValueError("差量补丁损坏")
+                while length:
+                    size = min(length, DOWNLOAD_CHUNK_SIZE)
+                    if op == b'C':
+                        data = _read_exact(source, size)
+                    elif op == b'D':
+                        data = _xor(_read_exact(stream, size), _read_exact(source, size))
+                    else:
+                        data = _read_exact(stream, size)
+                    out.write(data)
+                    digest.update(data)
+                    length -= size
+                    written += size
+            out.flush()
+            os.fsync(out.fileno())
+        if written != target_size or digest.digest() != target_digest:
+            raise ValueError("补丁应用结果校验失败")
+
 
 class UpdateManager:
-    """更新管理器"""
-    
-    def __init__(self):
+    """更新管理器
+
+    从更新源（http(s):// 或 file:// 镜像）获取 manifest.json，
+    按差量补丁链把本地特征库更新到最新版本，补丁总量超过完整特征库时直接下载完整文件。
+    下载支持断点续传，下载文件与更新结果均校验 SHA-256，校验通过后原子替换特征库。
+    """
+
+    def __init__(self, mirror_url=None, db_path='signatures.db', download_dir='updates'):
         self.current_version = "1.0.0"
         self.latest_version = "1.0.0"
-    
+        self.settings_file = os.path.join(os.getcwd(), 'update_settings.json')
+        self.mirror_url = mirror_url or self._load_mirror()
+        self.db_path = db_path
+        self.download_dir = download_dir
+        self.manifest = None
+        self.signature_version = None
+        self.latest_signature_version = None
+        self.bytes_downloaded = 0
+
+    def _load_mirror(self):
+        """从 update_settings.json 读取更新源地址"""
+        try:
+            with open(self.settings_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('mirror')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _url(self, name):
+        return urljoin(self.mirror_url.rstrip('/') + '/', name)
+
+    def _installed_signature_version(self):
+        try:
+            return SignatureMatcher.db_version(self.db_path)
+        except (OSError, ValueError):
+            return None
+
+    # ---- 网络 ----
+
+    @staticmethod
+    def _open(url, offset=0):
+        """打开 URL，从 offset 处开始读取；返回 (流, 实际起始位置)"""
+        parsed = urlparse(url)
+        if parsed.scheme == 'file':
+            stream = open(url2pathname(parsed.path), 'rb')
+            stream.seek(offset)
+            return stream, offset
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        response = urlopen(Request(url, headers=headers), timeout=DOWNLOAD_TIMEOUT)
+        # 服务器不支持断点续传时从头下载
+        if offset and response.status != 206:
+            offset = 0
+        return response, offset
+
+    def fetch_manifest(self):
+        """获取更新清单"""
+        stream, _ = self._open(self._url(MANIFEST_NAME))
+        with stream:
+            self.manifest = json.loads(stream.read().decode('utf-8'))
+        self.latest_version = self.manifest.get('app_version', self.current_version)
+        self.latest_signature_version = self.manifest['signatures']['version']
+        return self.manifest
+
+    def download(self, artifact, progress=None):
+        """下载清单中的一个文件（支持断点续传），校验 SHA-256 后返回本地路径"""
+        os.makedirs(self.download_dir, exist_ok=True)
+        dest = os.path.join(self.download_dir, os.path.basename(artifact['url']))
+        if os.path.exists(dest) and file_sha256(dest) == artifact['sha256']:
+            if progress:
+                progress(artifact['size'])
+            return dest
+
+        part = dest + '.part'
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset >= artifact['size']:
+            # 上次已下载完整但未改名：校验通过直接使用，否则从头下载
+            if offset == artifact['size'] and file_sha256(part) == artifact['sha256']:
+                os.replace(part, dest)
+                if progress:
+                    progress(artifact['size'])
+                return dest
+            offset = 0
+        url = self._url(artifact['url'])
+        try:
+            stream, offset = self._open(url, offset)
+        except HTTPError as e:
+            # 416：服务器不接受续传范围，丢弃已下载部分后从头下载
+            if e.code != 416 or not offset:
+                raise
+            e.close()
+            os.remove(part)
+            stream, offset = self._open(url, 0)
+        digest = hashlib.sha256()
+        with stream, open(part, 'ab' if offset else 'wb') as out:
+            if offset:
+                # 续传时先把已下载部分计入校验
+                out.truncate(offset)
+                with open(part, 'rb') as existing:
+                    for data in iter(lambda: existing.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        digest.update(data)
+                if progress:
+                    progress(offset)
+            while True:
+                data = stream.read(DOWNLOAD_CHUNK_SIZE)
+                if not data:
+                    break
+                out.write(data)
+                digest.update(data)
+                self.bytes_downloaded += len(data)
+                if progress:
+                    progress(len(data))
+            out.flush()
+            os.fsync(out.fileno())
+
+        if digest.hexdigest() != artifact['sha256']:
+            os.remove(part)
+            raise ValueError(f"文件校验失败: {artifact['url']}")
+        os.replace(part, dest)
+        return dest
+
+    # ---- 更新计划 ----
+
+    def plan_update(self):
+        """计算更新步骤：返回 ('delta', [补丁, ...]) 或 ('full', 完整特征库)，已是最新时返回 (None, None)"""
+        signatures = self.manifest['signatures']
+        current = self._installed_signature_version()
+        self.signature_version = current
+        if current == signatures['version']:
+            return None, None
+        chain = self._delta_chain(current, signatures['version'], signatures.get('deltas', []))
+        if chain is not None and sum(delta['size'] for delta in chain) < signatures['db']['size']:
+            return 'delta', chain
+        return 'full', signatures['db']
+
+    @staticmethod
+    def _delta_chain(source, target, deltas):
+        """按补丁的 from/to 版本广度优先查找最短补丁链，找不到时返回 None"""
+        if source is None:
+            return None
+        edges = {}
+        for delta in deltas:
+            edges.setdefault(delta['from'], []).append(delta)
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            version = queue.popleft()
+            if version == target:
+                chain = []
+                while previous[version] is not None:
+                    chain.append(previous[version])
+                    version = previous[version]['from']
+                return chain[::-1]
+            for delta in edges.get(version, ()):
+                if delta['to'] not in previous:
+                    previous[delta['to']] = delta
+                    queue.append(delta['to'])
+        return None
+
+    # ---- 检查与安装 ----
+
     def check_update(self):
-        """检查更新"""
-        # 模拟检查更新
-        # 实际应用中，这里应该从服务器获取最新版本信息
-        time.sleep(1)  # 模拟网络延迟
-        
-        # 假设当前已是最新版本
-        # 如需测试更新功能，可将latest_version设置为更高版本
-        # self.latest_version = "1.1.0"
-        
-        return self.latest_version > self.current_version
-    
-    def download_update(self, progress_callback=None):
-        """下载更新"""
-        # 模拟下载更新
-        # 实际应用中，这里应该从服务器下载更新包
-        for i in range(101):
-            time.sleep(0.05)  # 模拟下载延迟
+        """检查更新，有新的特征库或软件版本时返回 True"""
+        if not self.mirror_url:
+            return False
+        self.fetch_manifest()
+        kind, _ = self.plan_update()
+        return kind is not None or parse_version(self.latest_version) > parse_version(self.current_version)
+
+    def update_signatures(self, progress_callback=None):
+        """更新特征库，返回新版本号；已是最新时返回 None"""
+        if self.manifest is None:
+            self.fetch_manifest()
+        kind, plan = self.plan_update()
+        if kind is None:
+            return None
+
+        artifacts = plan if kind == 'delta' else [plan]
+        total = sum(artifact['size'] for artifact in artifacts) or 1
+        received = [0]
+
+        def progress(size):
+            received[0] += size
             if progress_callback:
-                progress_callback.emit(i)
-        
-        return True
-    
-    def install_update(self):
-        """安装更新"""
-        # 模拟安装更新
-        # 实际应用中，这里应该安装下载的更新包
-        time.sleep(1)  # 模拟安装延迟
-        return True
-    
+                # 下载占 0-90%，应用与校验占剩余部分
+                progress_callback.emit(min(int(received[0] * 90 / total), 90))
+
+        files = [self.download(artifact, progress) for artifact in artifacts]
+
+        temp_path = self.db_path + '.new'
+        try:
+            if kind == 'full':
+                shutil.copyfile(files[0], temp_path)
+            else:
+                current = self.db_path
+                for index, delta_file in enumerate(files):
+                    output = f"{temp_path}.{index}"
+                    apply_delta(current, delta_file, output)
+                    if current != self.db_path:
+                        os.remove(current)
+                    current = output
+                os.replace(current, temp_path)
+            if file_sha256(temp_path) != self.manifest['signatures']['db']['sha256']:
+                raise ValueError("更新后的特征库校验失败")
+            if SignatureMatcher.db_version(temp_path) != self.latest_signature_version:
+                raise ValueError("更新后的特征库版本不符")
+            os.replace(temp_path, self.db_path)
+        finally:
+            for leftover in [temp_path] + [f"{temp_path}.{i}" for i in range(len(files))]:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        for path in files:
+            os.remove(path)
+
+        if progress_callback:
+            progress_callback.emit(100)
+        self.signature_version = self.latest_signature_version
+        return self.signature_version
+
     def check_and_update(self, progress_callback=None):
         """检查并更新"""
-        # 检查更新
-        if not self.check_update():
+        if not self.mirror_url:
+            return False, "未配置更新源，请在 update_settings.json 中设置 mirror"
+        try:
+            self.fetch_manifest()
+            version = self.update_signatures(progress_callback)
+        except PermissionError:
+            return False, "特征库正在使用中，请停止扫描后重试"
+        except (OSError, ValueError, KeyError) as e:
+            return False, f"更新失败: {e}"
+
+        messages = []
+        if version:
+            messages.append(f"特征库已更新到版本 {version}（下载 {self.bytes_downloaded} 字节）")
+        if parse_version(self.latest_version) > parse_version(self.current_version):
+            messages.append(f"发现新版本软件 {self.latest_version}，请前往官网下载")
+        if not messages:
             return False, "当前已是最新版本"
-        
-        # 下载更新
-        if not self.download_update(progress_callback):
-            return False, "下载更新失败"
-        
-        # 安装更新
-        if not self.install_update():
-            return False, "安装更新失败"
-        
-        return True, f"已成功更新到版本 {self.latest_version}"
+        return True, "\n".join(messages)
+
+
+def publish(mirror_dir, new_db, old_dbs=(), app_version=None):
+    """发布特征库到镜像目录：复制完整特征库，生成各旧版本到新版本的补丁并更新 manifest.json"""
+    os.makedirs(mirror_dir, exist_ok=True)
+    manifest_path = os.path.join(mirror_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    version = SignatureMatcher.db_version(new_db)
+    db_name = f"signatures-{version}.db"
+    shutil.copyfile(new_db, os.path.join(mirror_dir, db_name))
+    signatures = manifest.get('signatures', {})
+    deltas = signatures.get('deltas', [])
+    for old_db in old_dbs:
+        old_version = SignatureMatcher.db_version(old_db)
+        if old_version == version:
+            continue
+        delta_name = f"signatures-{old_version}-{version}.delta"
+        delta_path = os.path.join(mirror_dir, delta_name)
+        make_delta(old_db, new_db, delta_path)
+        deltas = [d for d in deltas if not (d['from'] == old_version and d['to'] == version)]
+        deltas.append({'from': old_version, 'to': version, 'url': delta_name,
+                       'size': os.path.getsize(delta_path), 'sha256': file_sha256(delta_path)})
+
+    manifest['signatures'] = {
+        'version': version,
+        'db': {'url': db_name, 'size': os.path.getsize(new_db), 'sha256': file_sha256(new_db)},
+        'deltas': deltas,
+    }
+    if app_version:
+        manifest['app_version'] = app_version
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    """命令行:
+    python -m core.update_manager publish 镜像目录 新特征库.db [旧特征库.db ...]
+    python -m core.update_manager delta 旧文件 新文件 补丁文件
+    python -m core.update_manager apply 旧文件 补丁文件 新文件
+    python -m core.update_manager update [更新源URL]
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else None
+    if command == 'publish' and len(argv) >= 3:
+        manifest = publish(argv[1], argv[2], argv[3:])
+        print(f"已发布特征库版本 {manifest['signatures']['version']}，补丁 {len(manifest['signatures']['deltas'])} 个")
+        return 0
+    if command == 'delta' and len(argv) == 4:
+        print(f"补丁大小: {make_delta(argv[1], argv[2], argv[3])} 字节")
+        return 0
+    if command == 'apply' and len(argv) == 4:
+        apply_delta(argv[1], argv[2], argv[3])
+        return 0
+    if command == 'update':
+        success, message = UpdateManager(argv[1] if len(argv) > 1 else None).check_and_update()
+        print(message)
+        return 0 if success else 1
+    print(main.__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
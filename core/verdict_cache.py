@@ -0,0 +1,100 @@
+import sqlite3
+import time
+
+
+class VerdictCache:
+    """扫描结果缓存
+
+    将未发现威胁的文件记录在 SQLite 文件中，键为 (st_dev, st_ino, 大小, mtime_ns, ctime_ns)，
+    并标记特征库版本。再次扫描时文件元数据与特征库版本均未变化即可跳过内容扫描。
+    """
+
+    # 命中记录的最近使用时间刷新间隔（秒），避免重复扫描时逐条写库
+    REFRESH_INTERVAL = 24 * 3600
+    # 每累计多少次写入提交一次事务
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, cache_path, db_version, max_entries=1000000):
+        self.db_version = db_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self._pending = 0
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            'dev INTEGER NOT NULL, ino INTEGER NOT NULL, size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, ctime_ns INTEGER NOT NULL, '
+            'db_version TEXT NOT NULL, last_seen INTEGER NOT NULL, '
+            'PRIMARY KEY (dev, ino))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_verdicts_last_seen ON verdicts (last_seen)')
+        # 清除旧版本特征库留下的记录
+        self.conn.execute('DELETE FROM verdicts WHERE db_version != ?', (db_version,))
+        self.conn.commit()
+        self._now = int(time.time())
+
+    @staticmethod
+    def make_key(entry):
+        """根据 DirEntry 生成缓存键，无法获取 inode 时返回 None"""
+        try:
+            inode = entry.inode()
+            st = entry.stat()
+        except OSError:
+            return None
+        if not inode:
+            return None
+        return (st.st_dev, inode, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+    def is_clean(self, key):
+        """检查文件自上次扫描后是否未变化且结果为安全"""
+        if key is None:
+            return False
+        row = self.conn.execute(
+            'SELECT size, mtime_ns, ctime_ns, db_version, last_seen FROM verdicts WHERE dev = ? AND ino = ?',
+            key[:2]
+        ).fetchone()
+        if row is None or row[:3] != key[2:] or row[3] != self.db_version:
+            return False
+        self.hits += 1
+        if self._now - row[4] > self.REFRESH_INTERVAL:
+            self.conn.execute('UPDATE verdicts SET last_seen = ? WHERE dev = ? AND ino = ?', (self._now,) + key[:2])
+            self._count_write()
+        return True
+
+    def store_clean(self, key):
+        """记录安全文件"""
+        if key is None:
+            return
+        self.conn.execute(
+            'INSERT OR REPLACE INTO verdicts (dev, ino, size, mtime_ns, ctime_ns, db_version, last_seen) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            key + (self.db_version, self._now)
+        )
+        self._count_write()
+
+    def _count_write(self):
+        self._pending += 1
+        if self._pending >= self.COMMIT_INTERVAL:
+            self.conn.commit()
+            self._pending = 0
+
+    def _evict(self):
+        """超出容量时淘汰最久未使用的记录"""
+        count = self.conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                'DELETE FROM verdicts WHERE rowid IN '
+                '(SELECT rowid FROM verdicts ORDER BY last_seen LIMIT ?)',
+                (excess,)
+            )
+
+    def close(self):
+        """提交写入、淘汰超量记录并关闭"""
+        try:
+            self._evict()
+            self.conn.commit()
+        finally:
+            self.conn.close()
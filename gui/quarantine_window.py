@@ -1,14 +1,48 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QListWidget, QListWidgetItem, QMessageBox
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QListWidget, QListWidgetItem, QMessageBox
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from core.quarantine_manager import QuarantineManager
+from core.quarantine_retention import RetentionPolicy
+
+class CompactThread(QThread):
+    """隔离区清理线程：按保留策略分批删除项目"""
+    batch_compacted = pyqtSignal(list)
+    compact_completed = pyqtSignal(int, int)
+    
+    def __init__(self, quarantine_manager, policy):
+        super().__init__()
+        self.quarantine_manager = quarantine_manager
+        self.policy = policy
+        
+    def run(self):
+        removed_count = 0
+        reclaimed = 0
+        for removed, freed in self.quarantine_manager.compact(self.policy, should_stop=self.isInterruptionRequested):
+            removed_count += len(removed)
+            reclaimed += freed
+            self.batch_compacted.emit(removed)
+        self.compact_completed.emit(removed_count, reclaimed)
 
 class QuarantineWindow(QWidget):
+    # 按保留策略自动清理的间隔（毫秒）
+    RETENTION_INTERVAL = 60 * 60 * 1000
+    
     def __init__(self):
         super().__init__()
         self.init_ui()
         self.quarantine_manager = QuarantineManager()
+        self.compact_thread = None
+        self.emptying = False
         self.load_quarantine_items()
         
+        # 按保留策略定期在后台清理
+        self.retention_policy = RetentionPolicy.load()
+        if self.retention_policy.enabled:
+            self.retention_timer = QTimer(self)
+            self.retention_timer.timeout.connect(self.apply_retention)
+            self.retention_timer.start(self.RETENTION_INTERVAL)
+            self.apply_retention()
+        QApplication.instance().aboutToQuit.connect(self.stop_compaction)
+        
     def init_ui(self):
         layout = QVBoxLayout(self)
         
@@ -55,7 +89,7 @@ class QuarantineWindow(QWidget):
         if quarantine_items:
             for item in quarantine_items:
                 list_item = QListWidgetItem(f"{item['file_name']} - {item['quarantine_time']}")
-                list_item.setData(Qt.UserRole, item['file_path'])
+                list_item.setData(Qt.UserRole, item['id'])
                 self.quarantine_list.addItem(list_item)
             self.status_label.setText(f"隔离区状态: 共 {len(quarantine_items)} 个文件")
         else:
@@ -68,14 +102,11 @@ class QuarantineWindow(QWidget):
             QMessageBox.information(self, "提示", "请选择要恢复的文件")
             return
         
-        for item in selected_items:
-            file_path = item.data(Qt.UserRole)
-            success = self.quarantine_manager.restore_file(file_path)
-            if success:
-                self.quarantine_list.takeItem(self.quarantine_list.row(item))
+        item_ids = [item.data(Qt.UserRole) for item in selected_items]
+        results = self.quarantine_manager.restore_many(item_ids)
+        restored = self.remove_finished_items(results)
         
-        QMessageBox.information(self, "成功", f"已恢复 {len(selected_items)} 个文件")
-        self.load_quarantine_items()
+        self.show_batch_result("恢复", restored, len(item_ids))
     
     def delete_selected(self):
         """删除选中的文件"""
@@ -88,26 +119,86 @@ class QuarantineWindow(QWidget):
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            for item in selected_items:
-                file_path = item.data(Qt.UserRole)
-                success = self.quarantine_manager.delete_file(file_path)
-                if success:
-                    self.quarantine_list.takeItem(self.quarantine_list.row(item))
+            item_ids = [item.data(Qt.UserRole) for item in selected_items]
+            results = self.quarantine_manager.delete_many(item_ids)
+            deleted = self.remove_finished_items(results)
             
-            QMessageBox.information(self, "成功", f"已删除 {len(selected_items)} 个文件")
-            self.load_quarantine_items()
+            self.show_batch_result("删除", deleted, len(item_ids))
+    
+    def remove_finished_items(self, results):
+        """从列表中移除操作成功的项目（只遍历一次列表，不重新加载），返回移除的数量"""
+        finished = {item_id for item_id, success in results.items() if success}
+        self.quarantine_list.setUpdatesEnabled(False)
+        try:
+            for row in range(self.quarantine_list.count() - 1, -1, -1):
+                if self.quarantine_list.item(row).data(Qt.UserRole) in finished:
+                    self.quarantine_list.takeItem(row)
+        finally:
+            self.quarantine_list.setUpdatesEnabled(True)
+        
+        count = self.quarantine_list.count()
+        self.status_label.setText(f"隔离区状态: 共 {count} 个文件" if count else "隔离区状态: 空")
+        return len(finished)
+    
+    def show_batch_result(self, action, succeeded, total):
+        """显示批量操作结果"""
+        if succeeded == total:
+            QMessageBox.information(self, "成功", f"已{action} {succeeded} 个文件")
+        else:
+            QMessageBox.warning(self, "部分失败", f"已{action} {succeeded} 个文件，{total - succeeded} 个文件{action}失败")
     
     def empty_quarantine(self):
-        """清空隔离区"""
+        """清空隔离区（在后台分批删除，不阻塞界面）"""
         reply = QMessageBox.question(self, "确认", "确定要清空整个隔离区吗？此操作不可恢复。",
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            success = self.quarantine_manager.empty_quarantine()
-            if success:
-                self.quarantine_list.clear()
-                self.status_label.setText("隔离区状态: 空")
-                QMessageBox.information(self, "成功", "隔离区已清空")
+            self.emptying = True
+            self.empty_button.setEnabled(False)
+            self.start_compaction(RetentionPolicy(max_items=0))
+    
+    def apply_retention(self):
+        """按保留策略清理（已有清理在进行时跳过）"""
+        if self.compact_thread is None:
+            self.start_compaction(self.retention_policy)
+    
+    def start_compaction(self, policy):
+        """启动后台清理；正在进行的清理在当前批次完成后停止"""
+        self.stop_compaction()
+        self.compact_thread = CompactThread(self.quarantine_manager, policy)
+        self.compact_thread.batch_compacted.connect(self.on_batch_compacted)
+        self.compact_thread.compact_completed.connect(self.on_compact_completed)
+        self.compact_thread.start()
+    
+    def stop_compaction(self):
+        if self.compact_thread is not None:
+            self.compact_thread.requestInterruption()
+            self.compact_thread.wait()
+            self.compact_thread = None
+    
+    def on_batch_compacted(self, removed):
+        """每批删除完成后更新列表"""
+        self.remove_finished_items(dict.fromkeys(removed, True))
+    
+    def on_compact_completed(self, removed_count, reclaimed):
+        """清理完成，显示释放的空间"""
+        if self.sender() is not self.compact_thread:
+            return
+        self.compact_thread = None
+        
+        count = self.quarantine_list.count()
+        status = f"隔离区状态: 共 {count} 个文件" if count else "隔离区状态: 空"
+        if removed_count:
+            status += f"（已清理 {removed_count} 个文件，释放 {reclaimed / 1024 / 1024:.1f} MB）"
+        self.status_label.setText(status)
+        
+        if self.emptying:
+            self.emptying = False
+            self.empty_button.setEnabled(True)
+            if count:
+                QMessageBox.warning(self, "部分失败", f"已删除 {removed_count} 个文件，{count} 个文件删除失败")
+            else:
+                QMessageBox.information(self, "成功", f"隔离区已清空，释放 {reclaimed / 1024 / 1024:.1f} MB")
     
     def update_theme(self):
         """更新主题样式"""
@@ -1,31 +1,41 @@
+import os
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QProgressBar, QListWidget, QListWidgetItem, QRadioButton, QGroupBox, QFileDialog
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from core.scan_control import ScanControl
 from core.scan_engine import ScanEngine
+from core.scan_throttle import ScanThrottle
 
 class ScanThread(QThread):
     """扫描线程"""
-    progress_updated = pyqtSignal(int)
-    file_scanned = pyqtSignal(str)
+    batch_scanned = pyqtSignal(dict)
     scan_completed = pyqtSignal(list)
     
-    def __init__(self, scan_type, custom_path=None):
+    def __init__(self, scan_type, custom_path=None, workers=None):
         super().__init__()
         self.scan_type = scan_type
         self.custom_path = custom_path
+        self.workers = workers or os.cpu_count() or 1
+        self.control = ScanControl()
         
     def run(self):
-        engine = ScanEngine()
+        # 后台限速：系统繁忙时自动降低扫描速度
+        engine = ScanEngine(workers=self.workers, throttle=ScanThrottle.background(),
+                            control=self.control)
+        # 使用批量报告，避免逐个文件发送信号占满界面事件队列
         if self.scan_type == "quick":
-            results = engine.quick_scan(self.progress_updated, self.file_scanned)
+            results = engine.quick_scan(batch_callback=self.batch_scanned)
         elif self.scan_type == "full":
-            results = engine.full_scan(self.progress_updated, self.file_scanned)
+            results = engine.full_scan(batch_callback=self.batch_scanned)
         elif self.scan_type == "custom" and self.custom_path:
-            results = engine.custom_scan(self.custom_path, self.progress_updated, self.file_scanned)
+            results = engine.custom_scan(self.custom_path, batch_callback=self.batch_scanned)
         else:
             results = []
         self.scan_completed.emit(results)
 
 class ScanWindow(QWidget):
+    # 文件列表最多保留的行数
+    MAX_FILE_ROWS = 500
+    
     def __init__(self):
         super().__init__()
         self.init_ui()
@@ -99,11 +109,17 @@ class ScanWindow(QWidget):
         self.stop_button.setEnabled(False)
         self.stop_button.setStyleSheet("font-family: 'Microsoft YaHei';")
         
+        self.pause_button = QPushButton("暂停扫描")
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.pause_button.setEnabled(False)
+        self.pause_button.setStyleSheet("font-family: 'Microsoft YaHei';")
+        
         self.quit_button = QPushButton("关闭")
         self.quit_button.clicked.connect(self.close)
         self.quit_button.setStyleSheet("font-family: 'Microsoft YaHei';")
         
         button_layout.addWidget(self.stop_button)
+        button_layout.addWidget(self.pause_button)
         button_layout.addStretch()
         button_layout.addWidget(self.quit_button)
         
@@ -119,6 +135,8 @@ class ScanWindow(QWidget):
         # 禁用按钮
         self.scan_button.setEnabled(False)
         self.stop_button.setEnabled(True)
+        self.pause_button.setEnabled(True)
+        self.pause_button.setText("暂停扫描")
         
         # 重置UI
         self.progress_bar.setValue(0)
@@ -141,34 +159,64 @@ class ScanWindow(QWidget):
             self.status_label.setText("请选择自定义扫描路径")
             self.scan_button.setEnabled(True)
             self.stop_button.setEnabled(False)
+            self.pause_button.setEnabled(False)
             return
         
         # 创建并启动扫描线程
         self.scan_thread = ScanThread(scan_type, custom_path)
-        self.scan_thread.progress_updated.connect(self.update_progress)
-        self.scan_thread.file_scanned.connect(self.update_file_list)
+        self.scan_thread.batch_scanned.connect(self.update_batch)
         self.scan_thread.scan_completed.connect(self.scan_finished)
         self.scan_thread.start()
     
     def stop_scan(self):
+        """停止扫描：通知扫描线程在下一个取消点退出，并返回已扫描部分的结果"""
         if self.scan_thread and self.scan_thread.isRunning():
-            self.scan_thread.terminate()
-            self.status_label.setText("扫描已停止")
-            self.scan_button.setEnabled(True)
+            self.scan_thread.control.cancel()
+            self.status_label.setText("正在停止扫描...")
             self.stop_button.setEnabled(False)
+            self.pause_button.setEnabled(False)
     
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
+    def toggle_pause(self):
+        """暂停或继续扫描"""
+        if not (self.scan_thread and self.scan_thread.isRunning()):
+            return
+        control = self.scan_thread.control
+        if control.paused:
+            control.resume()
+            self.pause_button.setText("暂停扫描")
+            self.status_label.setText("正在扫描...")
+        else:
+            control.pause()
+            self.pause_button.setText("继续扫描")
+            self.status_label.setText("扫描已暂停")
     
-    def update_file_list(self, file_path):
-        item = QListWidgetItem(file_path)
-        self.file_list_widget.addItem(item)
+    def update_batch(self, report):
+        """批量更新进度与文件列表"""
+        self.progress_bar.setValue(report['progress'])
+        if not (self.scan_thread and self.scan_thread.control.paused):
+            self.status_label.setText(f"正在扫描... 已扫描 {report['scanned']} 个文件，发现 {report['threats']} 个威胁")
+        
+        paths = report['recent']
+        if not paths:
+            return
+        self.file_list_widget.setUpdatesEnabled(False)
+        self.file_list_widget.addItems(paths)
+        # 只保留最近的若干行
+        overflow = self.file_list_widget.count() - self.MAX_FILE_ROWS
+        for _ in range(max(overflow, 0)):
+            self.file_list_widget.takeItem(0)
+        self.file_list_widget.setUpdatesEnabled(True)
         self.file_list_widget.scrollToBottom()
     
     def scan_finished(self, results):
-        self.status_label.setText("扫描完成")
+        if self.scan_thread and self.scan_thread.control.cancelled:
+            self.status_label.setText("扫描已停止")
+        else:
+            self.status_label.setText("扫描完成")
         self.scan_button.setEnabled(True)
         self.stop_button.setEnabled(False)
+        self.pause_button.setEnabled(False)
+        self.pause_button.setText("暂停扫描")
         
         if results:
             self.result_label.setText(f"扫描结果: 发现 {len(results)} 个威胁")
@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QIcon
@@ -15,5 +16,7 @@ class AntivirusApp(QApplication):
         return self.exec_()
 
 if __name__ == "__main__":
+    # 扫描引擎使用多进程，打包为可执行文件时需要
+    multiprocessing.freeze_support()
     app = AntivirusApp(sys.argv)
     sys.exit(app.run())
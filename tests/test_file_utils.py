@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from utils.file_utils import get_full_scan_roots
+
+SAMPLE_MOUNTINFO = """\
+22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+23 22 0:21 / /proc rw,nosuid,nodev,noexec shared:12 - proc proc rw
+24 22 0:22 / /sys rw,nosuid,nodev,noexec shared:2 - sysfs sysfs rw
+25 24 0:23 / /sys/fs/cgroup ro,nosuid,nodev,noexec shared:3 - tmpfs tmpfs ro,mode=755
+26 25 0:24 / /sys/fs/cgroup/memory rw,nosuid,nodev,noexec shared:4 - cgroup cgroup rw,memory
+27 22 0:5 / /dev rw,nosuid shared:5 - devtmpfs udev rw,size=8000000k
+28 27 0:25 / /dev/shm rw,nosuid,nodev shared:6 - tmpfs tmpfs rw
+29 27 0:26 / /dev/mqueue rw,nosuid,nodev,noexec shared:7 - mqueue mqueue rw
+30 22 8:2 / /home rw,relatime shared:8 - ext4 /dev/sda2 rw
+31 22 0:27 / /mnt/share rw,relatime shared:9 - nfs4 server:/export rw
+32 31 0:28 / /mnt/share/cache rw,relatime shared:10 - tmpfs tmpfs rw
+33 22 0:29 / /run rw,nosuid,nodev shared:11 - tmpfs tmpfs rw
+34 22 0:30 / /devices rw,relatime shared:13 - ext4 /dev/sda3 rw
+"""
+
+
+class FullScanRootsTest(unittest.TestCase):
+    """完整扫描根目录：跳过伪文件系统、网络文件系统以及位于其下的挂载"""
+
+    def setUp(self):
+        fd, self.mountinfo = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write(SAMPLE_MOUNTINFO)
+
+    def tearDown(self):
+        os.remove(self.mountinfo)
+
+    def test_nested_mounts_under_skipped_are_skipped(self):
+        roots, skipped = get_full_scan_roots(mountinfo_path=self.mountinfo)
+        self.assertEqual(roots, ['/', '/home', '/run', '/devices'])
+        for mount_point in ('/proc', '/sys', '/sys/fs/cgroup', '/sys/fs/cgroup/memory', '/dev', '/dev/shm',
+                            '/dev/mqueue', '/mnt/share', '/mnt/share/cache'):
+            self.assertIn(mount_point, skipped)
+
+    def test_include_pseudo_and_remote(self):
+        roots, skipped = get_full_scan_roots(include_pseudo=True, include_remote=True,
+                                             mountinfo_path=self.mountinfo)
+        self.assertEqual(skipped, [])
+        self.assertIn('/dev/shm', roots)
+        self.assertIn('/mnt/share/cache', roots)
+
+    def test_skipped_root_does_not_hide_other_mounts(self):
+        with open(self.mountinfo, 'w') as f:
+            f.write('1 0 0:20 / / rw - nfs4 server:/root rw\n'
+                    '2 1 8:1 / /home rw - ext4 /dev/sda1 rw\n')
+        roots, skipped = get_full_scan_roots(mountinfo_path=self.mountinfo)
+        self.assertEqual(roots, ['/home'])
+        self.assertEqual(skipped, ['/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
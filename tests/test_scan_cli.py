@@ -0,0 +1,47 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(hasattr(os, 'killpg'), '需要进程组信号')
+class ProcessGroupInterruptTest(unittest.TestCase):
+    """终端 Ctrl+C 发给整个进程组时，多进程扫描应输出汇总并以 130 退出"""
+
+    def test_sigint_to_process_group(self):
+        with tempfile.TemporaryDirectory() as target:
+            for i in range(2000):
+                with open(os.path.join(target, f'file{i}.txt'), 'w') as f:
+                    f.write('clean')
+            proc = subprocess.Popen(
+                [sys.executable, '-m', 'core.scan_cli', '--no-cache', '--workers', '2',
+                 '--batch-size', '8', '--files-per-sec', '200', target],
+                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                start_new_session=True,
+            )
+            try:
+                # 等待工作进程启动并开始扫描
+                time.sleep(4)
+                os.killpg(proc.pid, signal.SIGINT)
+                stdout, stderr = proc.communicate(timeout=60)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.communicate()
+
+        self.assertEqual(proc.returncode, 130, stderr)
+        self.assertNotIn('Traceback', stderr)
+        summary = json.loads(stdout.strip().splitlines()[-1])
+        self.assertEqual(summary['type'], 'summary')
+        self.assertTrue(summary['cancelled'])
+        self.assertLess(summary['scanned'], 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,21 @@
 import os
 import os.path
+import re
+
+# 伪文件系统：内容由内核动态生成，不含需要扫描的文件
+PSEUDO_FS_TYPES = frozenset([
+    'proc', 'sysfs', 'devtmpfs', 'devpts', 'cgroup', 'cgroup2', 'securityfs', 'debugfs',
+    'tracefs', 'pstore', 'bpf', 'configfs', 'fusectl', 'mqueue', 'hugetlbfs', 'autofs',
+    'binfmt_misc', 'efivarfs', 'rpc_pipefs', 'nsfs', 'selinuxfs',
+])
+
+# 网络文件系统：遍历速度慢，且通常应由文件服务器自行扫描
+REMOTE_FS_TYPES = frozenset([
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', 'afs', '9p', 'ceph', 'lustre', 'glusterfs',
+    'fuse.sshfs', 'fuse.glusterfs', 'fuse.davfs2', 'fuse.rclone', 'fuse.s3fs', 'fuse.gvfsd-fuse',
+])
+
+_MOUNT_ESCAPE = re.compile(r'\\([0-7]{3})')
 
 
 def get_system_directories():
@@ -37,6 +53,60 @@ def get_system_directories():
     return system_dirs
 
 
+def _unescape_mount_path(path):
+    """还原 mountinfo 中以八进制转义的空格、制表符、换行与反斜杠"""
+    return _MOUNT_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), path)
+
+
+def read_mount_table(mountinfo_path='/proc/self/mountinfo'):
+    """读取挂载表，返回 [(挂载点, 文件系统类型), ...]，不支持的平台返回空列表"""
+    mounts = []
+    try:
+        with open(mountinfo_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                # 格式: ID 父ID 主:次设备号 根 挂载点 选项 [可选字段...] - 类型 来源 超级块选项
+                left, sep, right = line.partition(' - ')
+                fields = left.split()
+                if not sep or len(fields) < 5 or not right.split():
+                    continue
+                mounts.append((_unescape_mount_path(fields[4]), right.split()[0]))
+    except OSError:
+        return []
+    return mounts
+
+
+def get_full_scan_roots(include_pseudo=False, include_remote=False, mountinfo_path='/proc/self/mountinfo'):
+    """获取完整扫描的根目录
+
+    Linux 下根据挂载表返回需要扫描的挂载点，以及应跳过的伪文件系统与网络文件系统挂载点；
+    位于跳过的挂载点之下的挂载（如 /sys/fs/cgroup 下的 cgroup、/dev 下的 /dev/shm）同样跳过
+    （根目录 / 本身被跳过时除外）。Windows 下返回所有存在的驱动器。
+    返回 (扫描根目录列表, 跳过的挂载点列表)
+    """
+    mounts = read_mount_table(mountinfo_path)
+    if not mounts:
+        return [f'{chr(c)}:\\' for c in range(65, 91) if os.path.exists(f'{chr(c)}:\\')], []
+    
+    def is_skipped_type(fs_type):
+        return (not include_pseudo and fs_type in PSEUDO_FS_TYPES) or \
+            (not include_remote and fs_type in REMOTE_FS_TYPES)
+
+    # 挂载表中子挂载不一定排在父挂载之后，先收集所有跳过的挂载点
+    skipped = [mount_point for mount_point, fs_type in mounts if is_skipped_type(fs_type)]
+    prefixes = tuple(mount_point.rstrip('/') + '/' for mount_point in skipped if mount_point != '/')
+    roots = []
+    for mount_point, fs_type in mounts:
+        if is_skipped_type(fs_type):
+            continue
+        if mount_point.startswith(prefixes):
+            skipped.append(mount_point)
+        else:
+            roots.append(mount_point)
+    # 同一挂载点可能被多次挂载，只保留一次，顺序与挂载表一致
+    roots = list(dict.fromkeys(roots))
+    return roots, list(dict.fromkeys(skipped))
+
+
 def get_file_info(file_path):
     """获取文件信息"""
     try: